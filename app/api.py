@@ -1,73 +1,245 @@
-from fastapi import APIRouter, HTTPException
-import json
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from datetime import datetime
+import functools
 import os
+import zlib
 
-from app.tasks import scrape_all, scrape_amazon_offers, scrape_magalu_offers
+import anyio
+
+from app import metrics
+from app.cache import response_cache
+from app.history import get_history
+from app.models import json_page
+from app.storage import get_store
+from app.scrapers.registry import get_scraper, site_names, site_settings
+from app.tasks import scrape_all, scrape_site
 
 router = APIRouter()
-DATA_DIR = "data"
 
-def read_json_file(filename: str):
-    filepath = os.path.join(DATA_DIR, filename)
-    if not os.path.exists(filepath):
-        return []
+# Leituras do banco/histórico e publicações no broker rodam em threads, cada
+# grupo com seu próprio limite: consultas lentas não esgotam o threadpool
+# padrão do Starlette nem atrasam o enfileiramento de tarefas
+STORAGE_LIMITER = anyio.CapacityLimiter(int(os.getenv("API_STORAGE_THREADS", "8")))
+BROKER_LIMITER = anyio.CapacityLimiter(int(os.getenv("API_BROKER_THREADS", "4")))
+
+async def run_storage(func, *args, **kwargs):
+    """Executa uma leitura bloqueante fora do event loop, no pool de storage"""
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=STORAGE_LIMITER)
+
+async def enqueue(task, *args, **options):
+    """Publica uma tarefa Celery sem bloquear o event loop"""
+    return await anyio.to_thread.run_sync(functools.partial(task.apply_async, args, **options), limiter=BROKER_LIMITER)
+
+async def registered_site(site: str) -> str:
+    """Valida o site do path contra o registro de scrapers"""
+    if site not in site_names():
+        raise HTTPException(status_code=404, detail=f"Site desconhecido: {site}")
+    return site
+
+async def offer_filters(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor retornado em next_cursor"),
+    disponivel: Optional[bool] = None,
+    min_price: Optional[float] = Query(None, ge=0, description="Preço à vista mínimo em reais"),
+    max_price: Optional[float] = Query(None, ge=0, description="Preço à vista máximo em reais"),
+    q: Optional[str] = Query(None, description="Trecho do nome do produto"),
+    sort: str = Query("id", pattern="^(id|price_asc|price_desc)$")
+) -> Dict[str, Any]:
+    """Parâmetros de paginação, filtro e ordenação comuns às rotas /offers"""
+    return {
+        "limit": limit,
+        "cursor": cursor,
+        "disponivel": disponivel,
+        "min_price_cents": round(min_price * 100) if min_price is not None else None,
+        "max_price_cents": round(max_price * 100) if max_price is not None else None,
+        "name": q,
+        "sort": sort,
+    }
+
+def cached_offers(site: Optional[str], filters: Dict[str, Any]) -> bytes:
+    store = get_store()
+
+    def build():
+        offers, next_cursor = store.query_offers(site=site, **filters)
+        return json_page(offers, count=len(offers), next_cursor=next_cursor)
+
+    key = ("offers", store.data_version(), site, tuple(sorted(filters.items())))
+    return response_cache.get_or_build(key, build)
 
+async def list_offers(site: Optional[str], filters: Dict[str, Any]) -> Response:
     try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            data = json.load(f)
-            if not isinstance(data, list):
-                data = [data]
-            return data
-    except json.JSONDecodeError:
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = []
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        try:
-                            data.append(json.loads(line))
-                        except:
-                            pass
-                return data
-        except Exception as e:
-            print(f"Erro ao ler arquivo linha por linha: {str(e)}")
-            return []
-    except Exception as e:
-        print(f"Erro ao ler arquivo {filename}: {str(e)}")
-        return []
-
-@router.get("/offers/magalu")
-def get_magalu_offers():
-    data = read_json_file("magalu_offers.json")
-    return {"count": len(data), "offers": data}
-
-@router.get("/offers/amazon")
-def get_amazon_offers():
-    data = read_json_file("amazon_offers.json")
-    return {"count": len(data), "offers": data}
+        body = await run_storage(cached_offers, site, filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=body, media_type="application/json")
+
+def cached_changes(since_iso: Optional[str], site: Optional[str], limit: int, cursor: Optional[str]) -> bytes:
+    store = get_store()
+
+    def build():
+        changes, next_cursor = store.get_changes(since_iso, site, limit, cursor)
+        return {"count": len(changes), "changes": changes, "next_cursor": next_cursor}
+
+    key = ("changes", store.data_version(), since_iso, site, limit, cursor)
+    return response_cache.get_or_build(key, build)
+
+@router.get("/offers/changes")
+async def get_offer_changes(
+    since: Optional[datetime] = Query(None, description="Retorna mudanças a partir desta data/hora (ISO 8601)"),
+    site: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """Mudanças detectadas entre coletas: new, price_changed, availability_changed e gone"""
+    since_iso = since.isoformat() if since else None
+    try:
+        body = await run_storage(cached_changes, since_iso, site, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=body, media_type="application/json")
+
+def ndjson_chunks(site: Optional[str], compress: bool) -> Iterator[bytes]:
+    """Serializa as ofertas em NDJSON bloco a bloco, opcionalmente comprimido"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    for offers in get_store().iter_offers(site):
+        chunk = ("\n".join(offers) + "\n").encode("utf-8")
+        if compressor:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+async def stream_from_storage(chunks: Iterator[bytes]) -> AsyncIterator[bytes]:
+    """Consome um gerador bloqueante bloco a bloco pelo pool de storage"""
+    while True:
+        chunk = await run_storage(next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+@router.get("/offers/export")
+async def export_offers(
+    site: Optional[str] = None,
+    gzip: bool = Query(False, description="Comprime a resposta com gzip (Content-Encoding)")
+):
+    """Exporta todas as ofertas em NDJSON (uma oferta por linha) via streaming"""
+    headers = {"Content-Disposition": 'attachment; filename="offers.ndjson"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        stream_from_storage(ndjson_chunks(site, gzip)),
+        media_type="application/x-ndjson",
+        headers=headers
+    )
+
+@router.get("/offers/history")
+async def get_offer_history(
+    site: str,
+    url: str,
+    days: int = Query(30, ge=1, le=3650)
+):
+    """Menor, maior e último preço de uma oferta na janela de `days` dias"""
+    stats = await run_storage(get_history().stats, site, url, days)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Sem histórico para esta oferta no período")
+    return {"site": site, "url": url, "days": days, **stats}
+
+def cached_search(q: str, site: Optional[str], limit: int, cursor: Optional[str]) -> bytes:
+    store = get_store()
+
+    def build():
+        offers, next_cursor = store.search_offers(q, site, limit, cursor)
+        return json_page(offers, query=q, count=len(offers), next_cursor=next_cursor)
+
+    key = ("search", store.data_version(), q, site, limit, cursor)
+    return response_cache.get_or_build(key, build)
+
+@router.get("/offers/search")
+async def search_offers(
+    q: str = Query(..., min_length=1, max_length=200, description="Termos buscados no nome (prefixos, sem acento)"),
+    site: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None
+):
+    """Busca textual nas ofertas, ordenada por relevância"""
+    try:
+        body = await run_storage(cached_search, q, site, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=body, media_type="application/json")
 
 @router.get("/offers")
-def get_all_offers():
-    magalu_data = read_json_file("magalu_offers.json")
-    amazon_data = read_json_file("amazon_offers.json")
-    all_data = magalu_data + amazon_data
-    return {"count": len(all_data), "offers": all_data}
+async def get_all_offers(
+    site: Optional[str] = None,
+    filters: Dict[str, Any] = Depends(offer_filters)
+):
+    return await list_offers(site, filters)
+
+@router.get("/sites")
+async def get_sites():
+    """Sites registrados e suas configurações de agendamento"""
+    return {"sites": [site_settings(site) for site in site_names()]}
+
+# Rotas por site: declaradas depois das rotas fixas de /offers para não
+# capturar caminhos como /offers/changes
+@router.get("/offers/{site}")
+async def get_site_offers(
+    site: str = Depends(registered_site),
+    filters: Dict[str, Any] = Depends(offer_filters)
+):
+    return await list_offers(site, filters)
+
+def cached_product(product_id: int) -> bytes:
+    store = get_store()
+
+    def build():
+        product = store.get_product_offers(product_id)
+        if product is None:
+            raise KeyError(product_id)
+        return json_page(product.pop("offers"), **product)
+
+    key = ("product", store.data_version(), product_id)
+    return response_cache.get_or_build(key, build)
+
+@router.get("/products/{product_id}/offers")
+async def get_product_offers(product_id: int):
+    """Ofertas do mesmo produto em todos os sites, com o melhor preço disponível"""
+    try:
+        body = await run_storage(cached_product, product_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Produto não encontrado")
+    return Response(content=body, media_type="application/json")
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métricas no formato texto do Prometheus (API e workers)"""
+    body = await anyio.to_thread.run_sync(metrics.render_all, limiter=BROKER_LIMITER)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @router.post("/scrape")
 async def trigger_scraping():
     """Inicia o scraping de todas as ofertas"""
-    task = scrape_all.delay()
+    task = await enqueue(scrape_all)
     return {"message": "Scraping iniciado", "task_id": str(task.id)}
 
-@router.post("/scrape/magalu")
-async def trigger_magalu_scraping():
-    """Inicia o scraping apenas da Magazine Luiza"""
-    task = scrape_magalu_offers.delay()
-    return {"message": "Scraping Magalu iniciado", "task_id": str(task.id)}
-
-@router.post("/scrape/amazon")
-async def trigger_amazon_scraping():
-    """Inicia o scraping apenas da Amazon"""
-    task = scrape_amazon_offers.delay()
-    return {"message": "Scraping Amazon iniciado", "task_id": str(task.id)}
\ No newline at end of file
+@router.post("/scrape/{site}")
+async def trigger_site_scraping(
+    site: str = Depends(registered_site),
+    shard: Optional[List[str]] = Query(None, description="Shards a coletar (URLs ou termos de busca); sem shards faz a coleta completa")
+):
+    """Inicia o scraping de um site, completo ou apenas dos shards informados"""
+    scraper = get_scraper(site)()
+    priority = scraper.priority
+    # shards viram URLs buscadas pelo worker: nada fora do que o scraper aceita
+    rejected = [item for item in shard or [] if not scraper.accepts_shard(item)]
+    if rejected:
+        raise HTTPException(status_code=400, detail=f"Shards inválidos para {site}: {rejected}")
+    if not shard:
+        task = await enqueue(scrape_site, site, priority=priority)
+        return {"message": f"Scraping {site} iniciado", "task_id": str(task.id)}
+
+    task_ids = [str((await enqueue(scrape_site, site, item, priority=priority)).id) for item in shard]
+    return {"message": f"Scraping {site} iniciado", "task_ids": task_ids}
@@ -0,0 +1,60 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+import json
+import threading
+
+
+class ResponseCache:
+    """
+    Cache LRU em memória de respostas já serializadas.
+
+    As chaves incluem a versão dos dados (`OfferStore.data_version`), então
+    uma gravação nova invalida tudo naturalmente: as entradas antigas deixam
+    de ser consultadas e saem pelo LRU.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Hashable, body: bytes) -> None:
+        with self._lock:
+            self._entries[key] = body
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Any]) -> bytes:
+        """
+        Retorna os bytes em cache ou monta, serializa e guarda o payload;
+        `build` pode devolver o corpo já serializado (bytes)
+        """
+        body = self.get(key)
+        if body is None:
+            payload = build()
+            if isinstance(payload, bytes):
+                body = payload
+            else:
+                body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            self.put(key, body)
+        return body
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
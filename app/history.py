@@ -0,0 +1,167 @@
+from typing import Dict, List, Any, Optional, Iterable
+from datetime import datetime, timedelta, timezone
+import hashlib
+import logging
+import os
+import threading
+
+import numpy as np
+
+from app.models import Offer
+
+HISTORY_DIR = os.getenv("PRICE_HISTORY_DIR", os.path.join("data", "history"))
+RAW_RETENTION_DAYS = int(os.getenv("PRICE_HISTORY_RAW_DAYS", "30"))
+
+# Registro de 16 bytes: oferta (hash de site + url), instante (epoch em
+# segundos) e preço à vista em centavos
+RECORD_DTYPE = np.dtype([("key", "<u8"), ("ts", "<u4"), ("price", "<i4")])
+
+RAW_SUFFIX = ".bin"
+DAILY_SUFFIX = ".daily.bin"
+
+
+def offer_key(site: str, url: str) -> int:
+    digest = hashlib.blake2b(f"{site}\x1f{url}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class PriceHistory:
+    """
+    Histórico de preços em segmentos colunares append-only, um por dia.
+
+    Cada coleta acrescenta registros de tamanho fixo ao segmento do dia.
+    Segmentos mais antigos que `raw_retention_days` são reduzidos a no
+    máximo três pontos por oferta e dia (mínimo, máximo e último preço),
+    então o volume cresce com o número de ofertas e não com o de coletas.
+    As consultas mapeiam os segmentos em memória e filtram com NumPy.
+    """
+
+    def __init__(self, directory: str = HISTORY_DIR, raw_retention_days: int = RAW_RETENTION_DAYS):
+        self.directory = directory
+        self.raw_retention_days = raw_retention_days
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, day: str, suffix: str = RAW_SUFFIX) -> str:
+        return os.path.join(self.directory, day + suffix)
+
+    def append(self, site: str, offers: Iterable[Offer], when: Optional[datetime] = None) -> int:
+        """Acrescenta o preço atual das ofertas ao segmento do dia"""
+        when = when or datetime.now(timezone.utc)
+        ts = int(when.timestamp())
+        records = np.array(
+            [
+                (offer_key(site, offer.url), ts, offer.price_cents)
+                for offer in offers
+                if offer.price_cents is not None
+            ],
+            dtype=RECORD_DTYPE
+        )
+        if not len(records):
+            return 0
+
+        path = self._segment_path(when.astimezone(timezone.utc).strftime("%Y-%m-%d"))
+        # uma única escrita em modo append: processos concorrentes não intercalam registros
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, records.tobytes())
+        finally:
+            os.close(fd)
+        return len(records)
+
+    def _segments(self, start_day: str) -> List[str]:
+        paths = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(RAW_SUFFIX) and name[:10] >= start_day:
+                paths.append(os.path.join(self.directory, name))
+        return paths
+
+    @staticmethod
+    def _load(path: str) -> np.ndarray:
+        size = os.path.getsize(path)
+        count = size // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode="r", shape=(count,))
+
+    def stats(self, site: str, url: str, days: int = 30) -> Optional[Dict[str, Any]]:
+        """Mínimo, máximo e último preço da oferta na janela de `days` dias"""
+        key = offer_key(site, url)
+        since = datetime.now(timezone.utc) - timedelta(days=days)
+        since_ts = int(since.timestamp())
+
+        matches = []
+        for path in self._segments(since.strftime("%Y-%m-%d")):
+            segment = self._load(path)
+            if len(segment):
+                selected = segment[(segment["key"] == key) & (segment["ts"] >= since_ts)]
+                if len(selected):
+                    matches.append(np.array(selected))
+
+        if not matches:
+            return None
+
+        records = np.concatenate(matches)
+        last = records[np.argmax(records["ts"])]
+        return {
+            "min_price_cents": int(records["price"].min()),
+            "max_price_cents": int(records["price"].max()),
+            "last_price_cents": int(last["price"]),
+            "first_seen": _iso(int(records["ts"].min())),
+            "last_seen": _iso(int(last["ts"])),
+            "samples": int(len(records)),
+        }
+
+    def compact(self, now: Optional[datetime] = None) -> int:
+        """Reduz os segmentos brutos antigos a mínimo, máximo e último por oferta"""
+        now = now or datetime.now(timezone.utc)
+        cutoff = (now - timedelta(days=self.raw_retention_days)).strftime("%Y-%m-%d")
+        compacted = 0
+
+        for name in sorted(os.listdir(self.directory)):
+            if not name.endswith(RAW_SUFFIX) or name.endswith(DAILY_SUFFIX) or name[:10] >= cutoff:
+                continue
+            path = os.path.join(self.directory, name)
+            records = np.fromfile(path, dtype=RECORD_DTYPE)
+            reduced = downsample(records)
+
+            tmp_path = self._segment_path(name[:10], DAILY_SUFFIX) + ".tmp"
+            reduced.tofile(tmp_path)
+            os.replace(tmp_path, self._segment_path(name[:10], DAILY_SUFFIX))
+            os.remove(path)
+            compacted += 1
+            logging.info(f"Histórico {name[:10]} compactado: {len(records)} -> {len(reduced)} registros")
+
+        return compacted
+
+
+def downsample(records: np.ndarray) -> np.ndarray:
+    """Mantém, por oferta, os registros de menor preço, maior preço e o mais recente"""
+    if not len(records):
+        return records
+
+    by_price = records[np.lexsort((records["price"], records["key"]))]
+    by_time = records[np.lexsort((records["ts"], records["key"]))]
+
+    starts = np.flatnonzero(np.r_[True, by_price["key"][1:] != by_price["key"][:-1]])
+    ends = np.r_[starts[1:], len(records)] - 1
+
+    reduced = np.concatenate([by_price[starts], by_price[ends], by_time[ends]])
+    reduced = np.unique(reduced)
+    return reduced[np.lexsort((reduced["ts"], reduced["key"]))]
+
+
+def _iso(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+_history: Optional[PriceHistory] = None
+_history_lock = threading.Lock()
+
+
+def get_history() -> PriceHistory:
+    """Instância compartilhada do histórico de preços"""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = PriceHistory()
+        return _history
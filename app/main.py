@@ -1,5 +1,26 @@
-from fastapi import FastAPI
+import time
+
+from fastapi import FastAPI, Request
 from app.api import router
+from app.metrics import API_LATENCY
 
 app = FastAPI(title="Marketplace Offers API")
-app.include_router(router)
\ No newline at end of file
+app.include_router(router)
+
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    """Latência por rota (o template do path, não a URL) e status"""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        API_LATENCY.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status
+        )
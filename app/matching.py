@@ -0,0 +1,142 @@
+"""
+Casamento de ofertas do mesmo produto entre os sites.
+
+Cada título é reduzido a uma chave (marca, armazenamento, tokens do
+modelo). As ofertas só são comparadas dentro do mesmo bloco (marca,
+armazenamento), então o custo cresce com o tamanho dos blocos e não com o
+quadrado do catálogo; dentro do bloco os modelos são comparados por
+Jaccard dos tokens.
+"""
+from typing import FrozenSet, Iterable, NamedTuple, Optional, Tuple
+import re
+import unicodedata
+
+# Versão das regras de casamento; quando muda, os produtos de um banco já
+# existente são recalculados ao abri-lo
+MATCHING_VERSION = 2
+
+# Similaridade mínima (Jaccard dos tokens do modelo) para considerar o mesmo produto
+MATCH_THRESHOLD = 0.6
+
+# Marcas conhecidas e nomes de linha que identificam a marca sozinhos
+BRAND_ALIASES = {
+    "apple": "apple", "iphone": "apple", "ipad": "apple", "macbook": "apple", "airpods": "apple",
+    "samsung": "samsung", "galaxy": "samsung",
+    "motorola": "motorola", "moto": "motorola",
+    "xiaomi": "xiaomi", "redmi": "xiaomi", "poco": "xiaomi",
+    "lg": "lg", "philips": "philips", "lenovo": "lenovo", "dell": "dell", "sony": "sony",
+    "playstation": "sony", "multilaser": "multilaser", "positivo": "positivo", "asus": "asus",
+    "acer": "acer", "hp": "hp", "jbl": "jbl", "realme": "realme", "tcl": "tcl", "britania": "britania",
+    "mondial": "mondial", "electrolux": "electrolux", "brastemp": "brastemp", "consul": "consul",
+    "nintendo": "nintendo", "microsoft": "microsoft", "xbox": "microsoft", "huawei": "huawei",
+}
+
+# Palavras que não distinguem produtos: preposições, categorias e cores
+STOPWORDS = frozenset("""
+    de da do das dos com e para em por a o as os the with and for
+    smartphone celular notebook tablet smart tv monitor ouvido caixa som
+    novo original lacrado tela cor versao nacional garantia
+    preto preta branco branca azul verde vermelho vermelha rosa roxo cinza prata dourado grafite
+""".split())
+
+# Tokens que separam versões de um mesmo modelo: precisam coincidir
+VARIANT_TOKENS = frozenset(["pro", "max", "plus", "ultra", "lite", "mini", "fe", "neo", "air", "se"])
+
+# Acessórios citam o aparelho em que servem ("Capa Samsung Galaxy S23"): só
+# casam com acessórios do mesmo tipo, nunca com o próprio aparelho
+ACCESSORY_KINDS = {
+    "capa": "capa", "capinha": "capa", "case": "capa",
+    "pelicula": "pelicula", "protetor": "pelicula",
+    "carregador": "carregador", "fonte": "carregador", "adaptador": "carregador",
+    "cabo": "cabo", "suporte": "suporte", "fone": "fone", "pulseira": "pulseira",
+}
+
+# "128GB", "1 TB", "64 gb" -- exceto memória RAM ("8GB RAM", "8 GB de RAM")
+STORAGE_RE = re.compile(r"\b(\d+)\s*(gb|tb)\b(?!\s*(?:de\s+)?ram)")
+RAM_RE = re.compile(r"\b\d+\s*gb\s*(?:de\s+)?(?:memoria\s+)?ram\b")
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+class ProductKey(NamedTuple):
+    brand: str
+    storage: str
+    model: FrozenSet[str]
+
+    @property
+    def block(self) -> Tuple[str, str]:
+        return self.brand, self.storage
+
+
+def fold(text: str) -> str:
+    """Minúsculas sem acentos"""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def product_key(title: Optional[str]) -> Optional[ProductKey]:
+    """
+    Chave de casamento de um título, ou None quando a marca não é
+    reconhecida (a oferta fica sem produto)
+    """
+    if not title:
+        return None
+    text = fold(title)
+
+    capacities = [int(amount) * (1024 if unit == "tb" else 1) for amount, unit in STORAGE_RE.findall(text)]
+    storage = ""
+    if capacities:
+        # o maior valor é o armazenamento; RAM e afins costumam ser menores
+        gigabytes = max(capacities)
+        storage = f"{gigabytes // 1024}tb" if gigabytes >= 1024 and gigabytes % 1024 == 0 else f"{gigabytes}gb"
+    text = RAM_RE.sub(" ", STORAGE_RE.sub(" ", text))
+
+    tokens = TOKEN_RE.findall(text)
+    brand = next((BRAND_ALIASES[token] for token in tokens if token in BRAND_ALIASES), None)
+    if brand is None:
+        return None
+
+    model = frozenset(
+        ACCESSORY_KINDS.get(token, token) for token in tokens
+        if token != brand and token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    )
+    if not model:
+        return None
+    return ProductKey(brand, storage, model)
+
+
+def accessory_kinds(model: FrozenSet[str]) -> FrozenSet[str]:
+    """Tipos de acessório citados no modelo (vazio para o aparelho em si)"""
+    return frozenset(ACCESSORY_KINDS[token] for token in model if token in ACCESSORY_KINDS)
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """
+    Jaccard dos tokens do modelo; zero quando as variantes (pro, max...) ou
+    os tipos de acessório (capa, película...) diferem, ou quando os códigos
+    com dígitos de um título não estão contidos nos do outro ("s23" x
+    "s24", "15" x "14")
+    """
+    if not a or not b or a & VARIANT_TOKENS != b & VARIANT_TOKENS:
+        return 0.0
+    if accessory_kinds(a) != accessory_kinds(b):
+        return 0.0
+    codes_a = {token for token in a if any(char.isdigit() for char in token)}
+    codes_b = {token for token in b if any(char.isdigit() for char in token)}
+    if not (codes_a <= codes_b or codes_b <= codes_a):
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def best_match(
+    model: FrozenSet[str],
+    candidates: Iterable[Tuple[int, FrozenSet[str]]],
+    threshold: float = MATCH_THRESHOLD
+) -> Optional[int]:
+    """Id do candidato mais parecido do bloco, se passar do limite"""
+    best_id = None
+    best_score = threshold
+    for candidate_id, candidate_model in candidates:
+        score = similarity(model, candidate_model)
+        if score >= best_score and (best_id is None or score > best_score):
+            best_id, best_score = candidate_id, score
+    return best_id
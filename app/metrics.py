@@ -0,0 +1,256 @@
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+import bisect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - sem Redis, /metrics mostra só o processo da API
+    redis = None
+
+# Os workers do Celery publicam um snapshot das suas métricas no Redis após
+# cada tarefa; a API soma esses snapshots aos seus ao responder /metrics.
+# Vazio desativa a publicação.
+METRICS_REDIS_URL = os.getenv("METRICS_REDIS_URL", "redis://redis:6379/2")
+WORKER_KEY_PREFIX = "metrics:worker:"
+WORKER_KEY_TTL = 24 * 60 * 60
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[str, ...]
+
+
+class Counter:
+    """Contador monotônico com labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Labels:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> List[List[Any]]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    @staticmethod
+    def merge(current: Optional[float], value: float) -> float:
+        return (current or 0.0) + value
+
+    def samples(self, key: Labels, value: float) -> Iterator[Tuple[str, Labels, Tuple[str, ...], float]]:
+        yield self.name + "_total", key, (), value
+
+
+class Histogram:
+    """Histograma com buckets fixos; guarda contagens por bucket, soma e total"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Labels, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> Labels:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        # [contagem por bucket..., +Inf, soma]
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            data[index] += 1
+            data[-1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> List[List[Any]]:
+        with self._lock:
+            return [[list(key), list(data)] for key, data in self._values.items()]
+
+    @staticmethod
+    def merge(current: Optional[List[float]], value: List[float]) -> List[float]:
+        if current is None:
+            return list(value)
+        return [a + b for a, b in zip(current, value)]
+
+    def samples(self, key: Labels, data: List[float]) -> Iterator[Tuple[str, Labels, Tuple[str, ...], float]]:
+        cumulative = 0.0
+        for bound, count in zip(self.buckets, data):
+            cumulative += count
+            yield self.name + "_bucket", key, ("le", _format_value(bound)), cumulative
+        cumulative += data[len(self.buckets)]
+        yield self.name + "_bucket", key, ("le", "+Inf"), cumulative
+        yield self.name + "_sum", key, (), data[-1]
+        yield self.name + "_count", key, (), cumulative
+
+
+METRICS: List[Any] = []
+
+
+def _register(metric):
+    METRICS.append(metric)
+    return metric
+
+
+STAGE_SECONDS = _register(Histogram(
+    "scraper_stage_seconds",
+    "Tempo de cada etapa do scraping (fetch, parse, extract, normalize, save)",
+    ("site", "stage")
+))
+PAGES = _register(Counter("scraper_pages", "Páginas baixadas por status HTTP", ("site", "status")))
+BYTES_DOWNLOADED = _register(Counter("scraper_bytes_downloaded", "Bytes de corpo HTTP recebidos", ("site",)))
+OFFERS_PER_PAGE = _register(Histogram(
+    "scraper_offers_per_page",
+    "Ofertas extraídas por página",
+    ("site",),
+    buckets=(0, 1, 5, 10, 20, 50, 100, 200)
+))
+FAILURES = _register(Counter("scraper_failures", "Falhas do scraping por motivo", ("site", "reason")))
+API_LATENCY = _register(Histogram(
+    "api_request_duration_seconds",
+    "Latência das requisições da API",
+    ("method", "route", "status")
+))
+
+
+def stage(site: str, name: str):
+    """Context manager que mede uma etapa do scraping de um site"""
+    return STAGE_SECONDS.time(site=site, stage=name)
+
+
+def record_failure(site: str, reason: str) -> None:
+    FAILURES.inc(site=site, reason=reason)
+
+
+def snapshot() -> Dict[str, List[List[Any]]]:
+    """Estado atual das métricas do processo, serializável em JSON"""
+    return {metric.name: metric.snapshot() for metric in METRICS}
+
+
+def render(snapshots: Iterable[Dict[str, List[List[Any]]]]) -> str:
+    """Soma os snapshots e gera o formato texto do Prometheus"""
+    merged: Dict[str, Dict[Labels, Any]] = {metric.name: {} for metric in METRICS}
+    by_name = {metric.name: metric for metric in METRICS}
+    for snap in snapshots:
+        for name, values in snap.items():
+            metric = by_name.get(name)
+            if metric is None:
+                continue
+            for labels, value in values:
+                key = tuple(labels)
+                merged[name][key] = metric.merge(merged[name].get(key), value)
+
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key in sorted(merged[metric.name]):
+            for sample, labels, extra, value in metric.samples(key, merged[metric.name][key]):
+                pairs = list(zip(metric.labelnames, labels))
+                if extra:
+                    pairs.append(extra)
+                label_text = ",".join(f'{name}="{_escape(value_)}"' for name, value_ in pairs)
+                lines.append(f"{sample}{{{label_text}}} {_format_value(value)}" if label_text
+                             else f"{sample} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+_client = None
+_client_lock = threading.Lock()
+_missing_warned = False
+
+
+def _redis_client():
+    global _client, _missing_warned
+    if not METRICS_REDIS_URL:
+        return None
+    if redis is None:
+        if not _missing_warned:
+            logging.warning(
+                "METRICS_REDIS_URL configurado, mas o pacote redis não está instalado: "
+                "as métricas dos workers não chegam ao /metrics da API"
+            )
+            _missing_warned = True
+        return None
+    with _client_lock:
+        if _client is None:
+            _client = redis.Redis.from_url(METRICS_REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+        return _client
+
+
+def push_worker_metrics() -> None:
+    """Publica o snapshot deste processo no Redis (chamado pelos workers)"""
+    client = _redis_client()
+    if client is None:
+        return
+    key = f"{WORKER_KEY_PREFIX}{socket.gethostname()}:{os.getpid()}"
+    try:
+        client.set(key, json.dumps(snapshot()), ex=WORKER_KEY_TTL)
+    except redis.RedisError as e:
+        logging.warning(f"Não foi possível publicar as métricas do worker: {e}")
+
+
+def worker_snapshots() -> List[Dict[str, List[List[Any]]]]:
+    """Snapshots publicados pelos workers ainda dentro do TTL"""
+    client = _redis_client()
+    if client is None:
+        return []
+    snapshots = []
+    try:
+        keys = list(client.scan_iter(match=WORKER_KEY_PREFIX + "*", count=100))
+        for raw in client.mget(keys) if keys else []:
+            if raw:
+                snapshots.append(json.loads(raw))
+    except (redis.RedisError, ValueError) as e:
+        logging.warning(f"Não foi possível ler as métricas dos workers: {e}")
+    return snapshots
+
+
+def render_all() -> str:
+    """Métricas deste processo somadas às publicadas pelos workers"""
+    return render([snapshot()] + worker_snapshots())
@@ -0,0 +1,93 @@
+"""
+Modelo das ofertas coletadas.
+
+`Offer` usa __slots__: sem o dicionário por instância, cada oferta ocupa
+bem menos memória que um dict com as mesmas chaves e o acesso aos campos
+é direto. As ofertas circulam assim dos scrapers até a gravação; o
+formato compacto (uma lista por oferta, na ordem de FIELDS, sem repetir
+as chaves) é usado onde elas são guardadas ou trafegam fora do banco.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Union
+import json
+import operator
+
+FIELDS = (
+    "nome", "preco_vista", "preco_prazo", "disponivel", "url", "timestamp",
+    "price_cents", "installment_count", "installment_cents",
+)
+
+_field_values = operator.attrgetter(*FIELDS)
+_compact = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+class Offer:
+    """Oferta de um site; os campos numéricos são preenchidos pelo scraper ou por normalize_offers"""
+
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        nome: str,
+        preco_vista: Optional[str],
+        preco_prazo: Optional[str] = None,
+        disponivel: bool = True,
+        url: str = "",
+        timestamp: str = "",
+        price_cents: Optional[int] = None,
+        installment_count: Optional[int] = None,
+        installment_cents: Optional[int] = None,
+    ):
+        self.nome = nome
+        self.preco_vista = preco_vista
+        self.preco_prazo = preco_prazo
+        self.disponivel = disponivel
+        self.url = url
+        self.timestamp = timestamp
+        self.price_cents = price_cents
+        self.installment_count = installment_count
+        self.installment_cents = installment_cents
+
+    def to_list(self) -> List[Any]:
+        return list(_field_values(self))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(zip(FIELDS, _field_values(self)))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Offer":
+        return cls(**{name: data[name] for name in FIELDS if name in data})
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Offer):
+            return NotImplemented
+        return _field_values(self) == _field_values(other)
+
+    def __repr__(self) -> str:
+        return f"Offer(nome={self.nome!r}, preco_vista={self.preco_vista!r}, url={self.url!r})"
+
+
+def stamp(offers: Iterable[Offer], timestamp: str) -> None:
+    """Aplica o mesmo instante de coleta a um lote de ofertas"""
+    for offer in offers:
+        offer.timestamp = timestamp
+
+
+def encode_offers(offers: Iterable[Offer]) -> bytes:
+    """Serializa as ofertas no formato compacto (lista de listas)"""
+    return _compact.encode([_field_values(offer) for offer in offers]).encode("utf-8")
+
+
+def decode_offers(data: Union[str, bytes, List[List[Any]]]) -> List[Offer]:
+    """Inverso de `encode_offers`; aceita também as listas já decodificadas"""
+    rows = json.loads(data) if isinstance(data, (str, bytes)) else data
+    return [Offer(*row) for row in rows]
+
+
+def json_page(offers_json: List[str], **fields: Any) -> bytes:
+    """
+    Monta a resposta `{...campos, "offers": [...]}` a partir de ofertas já
+    serializadas (pelo próprio SQLite), sem decodificá-las para dicts
+    """
+    head = _compact.encode(fields)
+    separator = "," if fields else ""
+    return (head[:-1] + separator + '"offers":[' + ",".join(offers_json) + "]}").encode("utf-8")
@@ -0,0 +1,85 @@
+from typing import List, Optional, Tuple
+import re
+
+from app.models import Offer
+
+# "R$ 1.299,00", "1.299,", "R$ 1299,9" -> parte inteira e centavos
+PRICE_RE = re.compile(r"(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d{1,2}))?")
+
+# Versões por linha usadas no parse em lote: cada linha do texto é um valor
+# da coluna e sempre produz exatamente um match (grupos vazios quando não há
+# preço), então os matches ficam alinhados com as ofertas do lote
+PRICE_LINE_RE = re.compile(
+    r"^(?:[^\d\n]*(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d{1,2}))?)?.*$",
+    re.MULTILINE
+)
+INSTALLMENT_LINE_RE = re.compile(
+    r"^(?:.*?(\d{1,2})\s*x\s*(?:de\s*)?(?:R\$\s*)?(\d{1,3}(?:\.\d{3})+|\d+)(?:,(\d{1,2}))?)?.*$",
+    re.MULTILINE | re.IGNORECASE
+)
+
+
+def parse_price_cents(text: Optional[str]) -> Optional[int]:
+    """Converte um preço exibido no formato brasileiro em centavos"""
+    if not text:
+        return None
+    match = PRICE_RE.search(text)
+    if not match:
+        return None
+    return _to_cents(match.group(1), match.group(2))
+
+
+def _to_cents(reais: Optional[str], cents: Optional[str]) -> Optional[int]:
+    if not reais:
+        return None
+    return int(reais.replace(".", "")) * 100 + int((cents or "0").ljust(2, "0"))
+
+
+def _column_text(values: List[Optional[str]]) -> str:
+    """Junta uma coluna de strings em um único texto, uma linha por valor"""
+    return "\n".join((value or "").replace("\n", " ") for value in values)
+
+
+def parse_price_column(values: List[Optional[str]]) -> List[Optional[int]]:
+    """Converte uma coluna inteira de preços em centavos com uma única varredura"""
+    if not values:
+        return []
+    return [_to_cents(m.group(1), m.group(2)) for m in PRICE_LINE_RE.finditer(_column_text(values))]
+
+
+def parse_installment_column(values: List[Optional[str]]) -> Tuple[List[Optional[int]], List[Optional[int]]]:
+    """Extrai (quantidade de parcelas, valor da parcela em centavos) de uma coluna"""
+    if not values:
+        return [], []
+    counts = []
+    amounts = []
+    for m in INSTALLMENT_LINE_RE.finditer(_column_text(values)):
+        counts.append(int(m.group(1)) if m.group(1) else None)
+        amounts.append(_to_cents(m.group(2), m.group(3)))
+    return counts, amounts
+
+
+def normalize_offers(offers: List[Offer]) -> List[Offer]:
+    """
+    Normaliza um lote de ofertas acrescentando os campos numéricos
+    `price_cents`, `installment_count` e `installment_cents`.
+
+    As strings originais são mantidas. Os preços são processados por coluna
+    (uma varredura de regex por coluna do lote), e valores já preenchidos
+    pelo scraper, como os preços numéricos do JSON da Magalu, são mantidos.
+    """
+    if not offers:
+        return offers
+
+    prices = parse_price_column([offer.preco_vista for offer in offers])
+    counts, amounts = parse_installment_column([offer.preco_prazo for offer in offers])
+
+    for offer, price, count, amount in zip(offers, prices, counts, amounts):
+        if offer.price_cents is None:
+            offer.price_cents = price
+        if offer.installment_count is None:
+            offer.installment_count = count
+        if offer.installment_cents is None:
+            offer.installment_cents = amount
+
+    return offers
@@ -0,0 +1,74 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import os
+
+from app.scrapers.registry import get_scrapers
+from app.storage import get_store
+
+# Intervalo entre execuções do planner (beat) e quantos shards ele pode
+# despachar por execução, somando todos os sites
+PLANNER_INTERVAL = int(os.getenv("SCRAPE_PLANNER_INTERVAL", "300"))
+PLANNER_CAPACITY = int(os.getenv("SCRAPE_PLANNER_CAPACITY", "16"))
+
+# Janela usada para medir o rendimento recente (ofertas/s) de cada site
+YIELD_WINDOW = timedelta(hours=24)
+
+
+def due_shards(now: datetime) -> Dict[str, List[Optional[str]]]:
+    """Shards de cada site cuja última coleta é mais antiga que o `schedule` do site"""
+    store = get_store()
+    due = {}
+    for site, scraper_cls in get_scrapers().items():
+        last_runs = store.last_shard_runs(site)
+        cutoff = (now - timedelta(seconds=scraper_cls.schedule)).isoformat()
+        shards = scraper_cls().get_shards() or [None]
+        stale = [shard for shard in shards if last_runs.get(shard, "") < cutoff]
+        if stale:
+            # nunca coletados primeiro, depois os mais antigos
+            due[site] = sorted(stale, key=lambda shard: last_runs.get(shard, ""))
+    return due
+
+
+def site_scores(sites: List[str], now: datetime) -> Dict[str, float]:
+    """
+    Peso efetivo de cada site: o `weight` configurado ajustado pelo
+    rendimento recente em relação à média (entre 0.5x e 2x)
+    """
+    scrapers = get_scrapers()
+    yields = get_store().recent_yields((now - YIELD_WINDOW).isoformat())
+    mean_yield = sum(yields.values()) / len(yields) if yields else 0.0
+
+    scores = {}
+    for site in sites:
+        factor = 1.0
+        if mean_yield > 0 and site in yields:
+            factor = min(2.0, max(0.5, yields[site] / mean_yield))
+        scores[site] = scrapers[site].weight * factor
+    return scores
+
+
+def plan_scrapes(now: Optional[datetime] = None, capacity: int = PLANNER_CAPACITY) -> List[Tuple[str, Optional[str]]]:
+    """
+    Escolhe até `capacity` shards vencidos, intercalando os sites na
+    proporção dos seus pesos efetivos (round-robin ponderado suave). Sites
+    com menos shards vencidos que a sua cota liberam capacidade para os
+    demais; o que sobrar fica para a próxima execução.
+    """
+    now = now or datetime.now()
+    due = due_shards(now)
+    if not due:
+        return []
+
+    scores = site_scores(list(due), now)
+    current = {site: 0.0 for site in due}
+    plan = []
+    while len(plan) < capacity and due:
+        total = sum(scores[site] for site in due)
+        for site in due:
+            current[site] += scores[site]
+        site = max(due, key=lambda name: current[name])
+        current[site] -= total
+        plan.append((site, due[site].pop(0)))
+        if not due[site]:
+            del due[site]
+    return plan
@@ -1,12 +1,87 @@
-from app.scrapers.base_scraper import BaseScraper
+from app import metrics
+from app.models import Offer
+from app.scrapers.base_scraper import BaseScraper, iter_async
+from app.scrapers.registry import register
 from datetime import datetime
+from urllib.parse import urlsplit
 import logging
-import json
-from pathlib import Path
 import random
-import time
-
+import lxml.html
+from lxml import etree
+
+HTML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+AMAZON_HOST = "www.amazon.com.br"
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _first(expression):
+    """XPath compilado que retorna só o primeiro elemento, como select_one"""
+    return etree.XPath(f"({expression})[1]")
+
+
+# Seletores compilados uma única vez por processo. Os cards são testados em
+# ordem até um deles encontrar produtos; os campos de cada card são avaliados
+# de forma preguiçosa, só passando ao próximo seletor quando o anterior falha.
+CARD_XPATHS = [
+    ("deal-card", etree.XPath("//div[@data-testid='deal-card']")),
+    ("s-search-result", etree.XPath("//div[@data-component-type='s-search-result']")),
+    ("DealGridItem-module__dealItem", etree.XPath("//div[contains(@class, 'DealGridItem-module__dealItem')]")),
+    ("a-section a-spacing-base", etree.XPath("//div[contains(@class, 'a-section a-spacing-base')]")),
+    ("s-result-item", etree.XPath(
+        "//div[contains(@class, 'sg-col-4-of-24 sg-col-4-of-12 sg-col-4-of-36 s-result-item')]"
+    )),
+]
+FALLBACK_CARD_XPATH = etree.XPath(
+    f"//span[{_has_class('a-price')}]/ancestor::div[contains(@class, 'a-section')][1]"
+)
+
+NAME_XPATHS = [
+    _first(f".//span[{_has_class('a-size-base-plus')}]"),
+    _first(f".//span[{_has_class('a-size-medium')}]"),
+    _first(f".//a[{_has_class('a-link-normal')}]//span"),
+    _first(".//h2//a//span"),
+    _first(".//h2"),
+]
+PRICE_XPATHS = [
+    _first(f".//span[{_has_class('a-price')}]//*[{_has_class('a-offscreen')}]"),
+    _first(f".//span[{_has_class('a-price-whole')}]"),
+    _first(f".//span[{_has_class('a-price')}]"),
+]
+INSTALLMENT_XPATHS = [
+    _first(f".//span[{_has_class('a-size-small')}][contains(., 'x')]"),
+    _first(".//span[contains(., 'em até')]"),
+]
+UNAVAILABLE_XPATH = etree.XPath(
+    f"boolean(.//span[{_has_class('a-color-price')} and {_has_class('unavailablePrice')}]"
+    f" | .//span[{_has_class('a-color-error')}]"
+    " | .//span[contains(., 'Indisponível')])"
+)
+LINK_XPATH = etree.XPath("(.//a[@href])[1]/@href")
+
+
+def _text(element):
+    """Equivalente ao get_text(strip=True) do BeautifulSoup"""
+    return "".join(part.strip() for part in element.itertext())
+
+
+def _first_text(product, xpaths):
+    for xpath in xpaths:
+        elements = xpath(product)
+        if elements:
+            text = _text(elements[0])
+            if text:
+                return text
+    return None
+
+
+@register
 class AmazonScraper(BaseScraper):
+    name = "amazon"
+    schedule = 4 * 60 * 60
+
     def __init__(self):
         super().__init__()
         self.urls = [
@@ -26,161 +101,100 @@ class AmazonScraper(BaseScraper):
         self.logger = logging.getLogger(__name__)
 
     def get_offers(self):
-        offers = []
+        offers = list(self.iter_offers())
+
+        self.logger.info(f"Total de ofertas encontradas na Amazon: {len(offers)}")
+
+        self.capture.capture_offers(self.name, offers)
+
+        return offers
+
+    def iter_pages(self, shard=None, done=None):
+        urls = [url for url in ([shard] if shard else self.urls) if url not in (done or {})]
+
+        self.logger.info(f"Buscando {len(urls)} páginas da Amazon em paralelo")
+        for url, page_offers in iter_async(self.iter_page_offers(urls)):
+            if page_offers is not None:
+                self.logger.info(f"Página da Amazon processada: {url} ({len(page_offers)} ofertas)")
+            yield url, page_offers
+
+    def get_shards(self):
+        return list(self.urls)
 
-        for url in self.urls:
+    def accepts_shard(self, shard):
+        """Shards são URLs buscadas pelo worker: só páginas HTTPS do próprio site"""
+        parts = urlsplit(shard)
+        return parts.scheme == "https" and parts.netloc == AMAZON_HOST and not parts.username and not parts.port
+
+    def extract_offers(self, html_content, url):
+        """Extrai as ofertas de uma página de resultados da Amazon"""
+        return self.extract_offers_from_bytes(html_content.encode("utf-8"), url)
+
+    def extract_offers_from_bytes(self, body, url):
+        """O lxml parseia os bytes diretamente, sem decodificar a página"""
+        with metrics.stage(self.name, "parse"):
             try:
-                self.logger.info(f"Tentando scraping da Amazon: {url}")
-                html_content = self.fetch_page(url)
-
-                # salvar o html pra debugar
-                debug_path = Path("debug")
-                debug_path.mkdir(exist_ok=True)
-                with open(debug_path / f"amazon_debug_{url.split('/')[-1]}.html", "w", encoding="utf-8") as f:
-                    f.write(html_content)
-
-                soup = self.parse_html(html_content)
-
-                selectors = [
-                    {"type": "div", "attrs": {"data-testid": "deal-card"}},
-                    {"type": "div", "attrs": {"data-component-type": "s-search-result"}},
-                    {"type": "div", "attrs": {"class": "DealGridItem-module__dealItem"}},
-                    {"type": "div", "attrs": {"class": "a-section a-spacing-base"}},
-                    {"type": "div", "attrs": {"class": "sg-col-4-of-24 sg-col-4-of-12 sg-col-4-of-36 s-result-item"}}
-                ]
-
-                products = []
-                for selector in selectors:
-                    if "class" in selector["attrs"]:
-                        products = soup.find_all(selector["type"],
-                                               class_=lambda c: c and selector["attrs"]["class"] in c)
-                    else:
-                        products = soup.find_all(selector["type"], selector["attrs"])
-
-                    if products:
-                        self.logger.info(f"Encontrados {len(products)} produtos com o seletor {selector}")
-                        break
-
-                if not products:
-                    price_elements = soup.select("span.a-price")
-                    for price in price_elements:
-                        product_container = price.find_parent("div", class_=lambda c: c and "a-section" in c)
-                        if product_container:
-                            products.append(product_container)
-
-                    self.logger.info(f"Encontrados {len(products)} produtos com abordagem alternativa")
-
-                for product in products:
-                    try:
-                        name = None
-                        name_selectors = [
-                            product.select_one("span.a-size-base-plus"),
-                            product.select_one("span.a-size-medium"),
-                            product.select_one("a.a-link-normal span"),
-                            product.select_one("h2 a span"),
-                            product.select_one("h2")
-                        ]
-
-                        for selector in name_selectors:
-                            if selector and selector.get_text(strip=True):
-                                name = selector.get_text(strip=True)
-                                break
-
-                        price_vista = None
-                        price_selectors = [
-                            product.select_one("span.a-price .a-offscreen"),
-                            product.select_one("span.a-price-whole"),
-                            product.select_one("span.a-price")
-                        ]
-
-                        for selector in price_selectors:
-                            if selector:
-                                price_text = selector.get_text(strip=True)
-                                if price_text:
-                                    price_vista = price_text
-                                    break
-
-                        price_prazo = None
-                        installment_selectors = [
-                            product.select_one("span.a-size-small:contains('x')"),
-                            product.select_one("span:contains('em até')")
-                        ]
-
-                        for selector in installment_selectors:
-                            if selector and selector.get_text(strip=True):
-                                price_prazo = selector.get_text(strip=True)
-                                break
-
-                        disponivel = True
-                        unavailable_selectors = [
-                            product.select_one("span.a-color-price.unavailablePrice"),
-                            product.select_one("span.a-color-error"),
-                            product.select_one("span:contains('Indisponível')")
-                        ]
-
-                        for selector in unavailable_selectors:
-                            if selector:
-                                disponivel = False
-                                break
-
-                        link = None
-                        link_elem = product.select_one("a[href]")
-                        if link_elem:
-                            href = link_elem["href"]
-                            link = f"https://www.amazon.com.br{href}" if not href.startswith('http') else href
-
-                        if name and price_vista:
-                            offer = {
-                                "nome": name,
-                                "preco_vista": price_vista,
-                                "preco_prazo": price_prazo,
-                                "disponivel": disponivel,
-                                "url": link or url,
-                                "timestamp": datetime.now().isoformat()
-                            }
-                            offers.append(offer)
-                            self.logger.info(f"Oferta encontrada: {name}")
-
-                    except Exception as e:
-                        self.logger.error(f"Erro ao processar produto: {str(e)}")
-                        continue
-
-                if offers:
-                    break
-
-                time.sleep(random.uniform(1, 3))
+                tree = lxml.html.fromstring(body, parser=HTML_PARSER)
+            except (etree.ParserError, ValueError):
+                metrics.record_failure(self.name, "parse_error")
+                return []
 
-            except Exception as e:
-                self.logger.error(f"Erro durante o scraping da Amazon: {str(e)}")
+        with metrics.stage(self.name, "extract"):
+            return self.extract_from_tree(tree, url)
 
-        self.logger.info(f"Total de ofertas encontradas na Amazon: {len(offers)}")
+    def extract_from_tree(self, tree, url):
+        """Extrai as ofertas de uma página já parseada pelo lxml"""
+        offers = []
+        products = []
+        for selector, card_xpath in CARD_XPATHS:
+            products = card_xpath(tree)
+            if products:
+                self.logger.info(f"Encontrados {len(products)} produtos com o seletor {selector}")
+                break
+
+        if not products:
+            seen = set()
+            for container in FALLBACK_CARD_XPATH(tree):
+                if container not in seen:
+                    seen.add(container)
+                    products.append(container)
+
+            self.logger.info(f"Encontrados {len(products)} produtos com abordagem alternativa")
+
+        timestamp = datetime.now().isoformat()
+        for product in products:
+            try:
+                name = _first_text(product, NAME_XPATHS)
+                price_vista = _first_text(product, PRICE_XPATHS)
+                price_prazo = _first_text(product, INSTALLMENT_XPATHS)
+                disponivel = not UNAVAILABLE_XPATH(product)
 
-        if offers:
-            debug_path = Path("debug")
-            debug_path.mkdir(exist_ok=True)
-            with open(debug_path / "amazon_offers_debug.json", "w", encoding="utf-8") as f:
-                json.dump(offers, f, ensure_ascii=False, indent=2)
+                link = None
+                hrefs = LINK_XPATH(product)
+                if hrefs:
+                    href = hrefs[0]
+                    link = f"https://www.amazon.com.br{href}" if not href.startswith('http') else href
+
+                if name and price_vista:
+                    offers.append(Offer(name, price_vista, price_prazo, disponivel, link or url, timestamp))
+                    self.logger.info(f"Oferta encontrada: {name}")
+
+            except Exception as e:
+                metrics.record_failure(self.name, "product_error")
+                self.logger.error(f"Erro ao processar produto: {str(e)}")
+                continue
 
         return offers
 
-    def fetch_page(self, url):
-        """
-        Sobrescreve o método fetch_page do BaseScraper para incluir headers específicos
-        """
-        try:
-            user_agents = [
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Safari/605.1.15",
-                "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
-                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36"
-            ]
-
-            headers = self.headers.copy()
-            headers["User-Agent"] = random.choice(user_agents)
-
-            response = self.session.get(url, headers=headers, timeout=30)
-            response.raise_for_status()
-            return response.text
-        except Exception as e:
-            self.logger.error(f"Erro ao fazer requisição para {url}: {str(e)}")
-            return ""
\ No newline at end of file
+    def _get_headers(self):
+        """Headers específicos da Amazon com User-Agent rotativo"""
+        user_agents = [
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+            "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.0 Safari/605.1.15",
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0",
+            "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0.4430.212 Safari/537.36"
+        ]
+
+        headers = self.headers.copy()
+        headers["User-Agent"] = random.choice(user_agents)
+        return headers
@@ -1,15 +1,89 @@
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, List, AsyncIterator, Iterator, Tuple, TypeVar, Union
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
+import asyncio
 import random
+import time
 from datetime import datetime
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlsplit
 from requests.exceptions import RequestException
 
+from app import metrics
+from app.models import Offer, stamp
+
+from app.scrapers.capture import get_capture_sink
+from app.scrapers.http_cache import body_hash, default_http_cache
+from app.scrapers.parse_pool import discard_parse_pool, extract_page, get_parse_pool
+from app.scrapers.rate_limit import DEFAULT_PAUSE, RateLimitedError, get_rate_limiter, parse_retry_after
+
+T = TypeVar("T")
+
+
+def iter_async(items: AsyncIterator[T]) -> Iterator[T]:
+    """
+    Consome um gerador assíncrono a partir de código síncrono, item a item
+
+    O loop só avança enquanto o próximo item é aguardado; as requisições já
+    disparadas continuam nas threads enquanto o consumidor processa o item
+    anterior (por exemplo, gravando as ofertas no banco).
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(items.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        try:
+            loop.run_until_complete(items.aclose())
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            loop.close()
+
+
 class BaseScraper:
+    # Identificador do site, usado no armazenamento e nas capturas
+    name = "base"
+
+    # Limite de requisições simultâneas por host e token bucket compartilhado
+    # entre os workers: taxa sustentada (requisições/s) e rajada máxima
+    max_concurrency_per_host = 4
+    requests_per_second = 0.5
+    burst = 2
+
+    # Espera máxima por um token dentro do worker; acima disso a coleta
+    # levanta RateLimitedError e a tarefa é reagendada pelo Celery. Deve
+    # cobrir `max_concurrency_per_host / requests_per_second`, a espera das
+    # reservas que uma coleta sozinha mantém em aberto
+    max_token_wait = 10.0
+
+    # Status que indicam que o host quer menos requisições
+    throttle_statuses = (429, 503)
+
+    # Agendamento pelo planner: intervalo (s) entre coletas de cada shard,
+    # prioridade na fila do Celery (0-9) e peso na divisão da capacidade
+    # dos workers entre os sites
+    schedule = 6 * 60 * 60
+    priority = 5
+    weight = 1.0
+
     def __init__(self):
         self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=self.max_concurrency_per_host * 2
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.timeout = 30
+        self.http_cache = default_http_cache()
+        self.capture = get_capture_sink()
+        self.rate_limiter = get_rate_limiter()
 
     def _get_headers(self) -> Dict[str, str]:
         """Retorna headers randomizados para as requisições"""
@@ -24,26 +98,325 @@ class BaseScraper:
             "Accept-Language": "pt-BR,pt;q=0.9,en-US;q=0.8,en;q=0.7"
         }
 
-    def fetch_page(self, url: str) -> str:
-        """Faz a requisição HTTP com tratamento de erros"""
+    def reserve_token(self, host: str) -> float:
+        """
+        Reserva a próxima requisição ao host e retorna quanto esperar por ela
+
+        Levanta RateLimitedError, sem consumir o token, quando a espera
+        passaria de `max_token_wait`.
+        """
+        granted, wait = self.rate_limiter.reserve(host, self.requests_per_second, self.burst, self.max_token_wait)
+        if not granted:
+            raise RateLimitedError(host, wait)
+        return wait
+
+    def fetch_page(self, url: str, throttle: bool = True, as_bytes: bool = False) -> Union[str, bytes]:
+        """
+        Faz a requisição HTTP com tratamento de erros
+
+        Com o cache HTTP ativo a requisição é condicional (ETag/Last-Modified)
+        e uma resposta 304 devolve o corpo guardado. Respostas 429/503 reduzem
+        a taxa do host para todos os workers e levantam RateLimitedError, que
+        as tarefas transformam em uma nova tentativa agendada. Demais falhas
+        de rede/HTTP são registradas e propagadas: quem coleta precisa saber
+        que a página não foi lida. Com `throttle=False` o token já foi
+        reservado por quem chamou. Com `as_bytes=True` devolve o corpo sem
+        decodificar (para o pool de parse).
+        """
+        host = urlsplit(url).netloc
+        if throttle:
+            wait = self.reserve_token(host)
+            if wait > 0:
+                time.sleep(wait)
+
         try:
-            response = self.session.get(
-                url,
-                headers=self._get_headers(),
-                timeout=self.timeout
-            )
+            headers = self._get_headers()
+            if self.http_cache:
+                headers.update(self.http_cache.conditional_headers(url))
+
+            with metrics.stage(self.name, "fetch"):
+                response = self.session.get(
+                    url,
+                    headers=headers,
+                    timeout=self.timeout
+                )
+                self._count_response(response)
+
+                if response.status_code == 304 and self.http_cache:
+                    if as_bytes:
+                        cached = self.http_cache.read_body(url)
+                    else:
+                        cached = self.http_cache.read_text(url)
+                    if cached is not None:
+                        return cached
+                    # corpo sumiu do cache: refaz a requisição sem validadores
+                    response = self.session.get(url, headers=self._get_headers(), timeout=self.timeout)
+                    self._count_response(response)
+
+            if response.status_code in self.throttle_statuses:
+                metrics.record_failure(self.name, "rate_limited")
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                pause = DEFAULT_PAUSE if retry_after is None else retry_after
+                factor = self.rate_limiter.penalize(host, pause)
+                logging.warning(
+                    f"{host} respondeu {response.status_code}, pausando {pause:.0f}s "
+                    f"e reduzindo a taxa para {factor:.0%}"
+                )
+                raise RateLimitedError(host, pause)
+
             response.raise_for_status()
-            return response.text  
+            self.rate_limiter.reward(host)
+            if self.http_cache:
+                self.http_cache.store(
+                    url,
+                    response.content,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                    response.encoding
+                )
+            return response.content if as_bytes else response.text
         except RequestException as e:
+            metrics.record_failure(self.name, self._failure_reason(e))
             logging.error(f"Erro ao fazer requisição para {url}: {e}")
-            return ""
+            raise
+
+    def _count_response(self, response: requests.Response) -> None:
+        metrics.PAGES.inc(site=self.name, status=response.status_code)
+        metrics.BYTES_DOWNLOADED.inc(len(response.content or b""), site=self.name)
+
+    @staticmethod
+    def _failure_reason(error: RequestException) -> str:
+        if isinstance(error, requests.exceptions.Timeout):
+            return "timeout"
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return "connection"
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            return f"http_{error.response.status_code}"
+        return "request"
+
+    async def fetch_many(self, urls: List[str]) -> List[str]:
+        """
+        Busca várias páginas de forma concorrente.
+
+        As requisições passam pelo `FetchScheduler`: usam o pool de conexões
+        da sessão, respeitam o limite de concorrência por host e aguardam os
+        tokens do rate limit sem bloquear as demais. O resultado mantém a
+        ordem de `urls`; páginas que falharam retornam "" e RateLimitedError
+        é propagado.
+        """
+        if not urls:
+            return []
+
+        hosts = {urlsplit(url).netloc for url in urls}
+        workers = min(len(urls), self.max_concurrency_per_host * len(hosts))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            scheduler = FetchScheduler(self, executor)
+
+            async def fetch(url):
+                try:
+                    return await scheduler.fetch(url)
+                except RequestException:
+                    return ""
+
+            tasks = [asyncio.ensure_future(fetch(url)) for url in urls]
+            try:
+                return await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def fetch_all(self, urls: List[str]) -> List[str]:
+        """Versão síncrona de `fetch_many`"""
+        return asyncio.run(self.fetch_many(urls))
+
+    def extract_offers(self, html_content: str, url: str) -> List[Offer]:
+        """Extrai as ofertas do HTML de uma página do site"""
+        raise NotImplementedError
+
+    def extract_offers_from_bytes(self, body: bytes, url: str) -> List[Offer]:
+        """Extração a partir do corpo bruto; scrapers que parseiam bytes sobrescrevem"""
+        return self.extract_offers(body.decode("utf-8", errors="replace"), url)
+
+    def page_offers(self, url: str, body: Union[str, bytes]) -> List[Offer]:
+        """
+        Ofertas de uma página, reaproveitando a extração anterior quando o
+        corpo é idêntico ao da última vez (304 ou mesmo hash)
+        """
+        digest = body_hash(body) if self.http_cache and body else None
+        if digest:
+            offers = self.cached_page_offers(url, digest)
+            if offers is not None:
+                return offers
+
+        if isinstance(body, bytes):
+            offers = self.extract_offers_from_bytes(body, url)
+        else:
+            offers = self.extract_offers(body, url)
+        self.finish_page(url, body, digest, offers)
+        return offers
+
+    def cached_page_offers(self, url: str, digest: str) -> Optional[List[Offer]]:
+        offers = self.http_cache.get_offers(url, digest)
+        if offers is not None:
+            logging.info(f"Página sem alterações, reaproveitando {len(offers)} ofertas: {url}")
+            stamp(offers, datetime.now().isoformat())
+        return offers
+
+    def finish_page(
+        self,
+        url: str,
+        body: Union[str, bytes],
+        digest: Optional[str],
+        offers: List[Offer]
+    ) -> None:
+        """Métricas, cache de ofertas e captura de uma página recém-extraída"""
+        self._count_offers(offers)
+        if digest:
+            self.http_cache.put_offers(url, digest, offers)
+        self.capture.capture_page(self.name, url, body, len(offers))
+
+    async def page_offers_async(
+        self,
+        url: str,
+        body: Union[str, bytes],
+        executor: ThreadPoolExecutor
+    ) -> List[Offer]:
+        """
+        `page_offers` para os pipelines assíncronos
+
+        Com o pool de parse ativo e o corpo em bytes, parse e extração rodam
+        em outro processo sem ocupar threads; caso contrário, em `executor`.
+        """
+        loop = asyncio.get_running_loop()
+        pool = get_parse_pool()
+        if pool is None or not body or not isinstance(body, bytes):
+            return await loop.run_in_executor(executor, self.page_offers, url, body)
+
+        digest = body_hash(body) if self.http_cache else None
+        if digest:
+            offers = await loop.run_in_executor(executor, self.cached_page_offers, url, digest)
+            if offers is not None:
+                return offers
+
+        try:
+            offers = await asyncio.wrap_future(pool.submit(extract_page, self.name, url, body))
+        except BrokenProcessPool:
+            logging.error(f"Pool de parse quebrado, extraindo {url} em thread")
+            discard_parse_pool(pool)
+            offers = await loop.run_in_executor(executor, self.extract_offers_from_bytes, body, url)
+
+        await loop.run_in_executor(executor, self.finish_page, url, body, digest, offers)
+        return offers
+
+    async def iter_page_offers(self, urls: List[str]) -> AsyncIterator[Tuple[str, Optional[List[Offer]]]]:
+        """
+        Busca e extrai as páginas de `urls` em pipeline, emitindo
+        `(url, ofertas)` na ordem em que cada página fica pronta
+
+        A extração de uma página começa assim que ela chega, enquanto as
+        demais ainda estão sendo buscadas. Erros de uma página (busca ou
+        extração) são logados e ela é emitida com `None` no lugar das
+        ofertas; RateLimitedError é propagado.
+        """
+        if not urls:
+            return
+
+        as_bytes = get_parse_pool() is not None
+        hosts = {urlsplit(url).netloc for url in urls}
+        workers = min(len(urls), self.max_concurrency_per_host * len(hosts))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            scheduler = FetchScheduler(self, executor, as_bytes=as_bytes)
+
+            async def scrape(url):
+                try:
+                    body = await scheduler.fetch(url)
+                    return url, await self.page_offers_async(url, body, executor)
+                except RateLimitedError:
+                    raise
+                except Exception as e:
+                    logging.error(f"Erro durante o scraping de {url}: {str(e)}")
+                    return url, None
+
+            tasks = [asyncio.ensure_future(scrape(url)) for url in urls]
+            try:
+                for page in asyncio.as_completed(tasks):
+                    yield await page
+            finally:
+                # RateLimitedError ou consumidor que parou antes: as páginas
+                # restantes são canceladas e aguardadas, sem exceções órfãs
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    def iter_pages(
+        self,
+        shard: Optional[str] = None,
+        done: Optional[Dict[str, int]] = None
+    ) -> Iterator[Tuple[str, Optional[List[Offer]]]]:
+        """
+        Coleta emitindo `(url, ofertas)` à medida que cada página fica pronta
+
+        Sem `shard` percorre o site inteiro. As páginas em `done` (URL ->
+        ofertas, vindas do checkpoint de uma tentativa anterior) são puladas.
+        Páginas que falharam são emitidas com `None` e as que chegaram sem
+        produtos com uma lista vazia, para a tarefa saber se a coleta foi
+        completa.
+        """
+        raise NotImplementedError
+
+    def iter_offers(self, shard: Optional[str] = None, done: Optional[Dict[str, int]] = None) -> Iterator[Offer]:
+        """As ofertas de `iter_pages`, uma a uma"""
+        for _, offers in self.iter_pages(shard, done):
+            yield from offers or ()
+
+    def _count_offers(self, offers: List[Offer]) -> None:
+        metrics.OFFERS_PER_PAGE.observe(len(offers), site=self.name)
+        if not offers:
+            metrics.record_failure(self.name, "empty_page")
+
+    def get_shards(self) -> List[str]:
+        """Divide a coleta em partes independentes (URLs ou termos de busca)"""
+        return []
+
+    def accepts_shard(self, shard: str) -> bool:
+        """Se `shard` pode ser coletado sob demanda; por padrão só os de `get_shards`"""
+        return shard in self.get_shards()
 
     def parse_html(self, html_content: str) -> BeautifulSoup:
         """Parse do HTML com tratamento de erros"""
         if not html_content:
-            return BeautifulSoup("", "lxml") 
+            return BeautifulSoup("", "lxml")
         try:
             return BeautifulSoup(html_content, "lxml")
         except Exception as e:
             logging.error(f"Erro ao fazer parse do HTML: {e}")
-            return BeautifulSoup("", "lxml")
\ No newline at end of file
+            return BeautifulSoup("", "lxml")
+
+
+class FetchScheduler:
+    """Agenda chamadas de `fetch_page` respeitando limites por host"""
+
+    def __init__(self, scraper: BaseScraper, executor: ThreadPoolExecutor, as_bytes: bool = False):
+        self.scraper = scraper
+        self.executor = executor
+        self.as_bytes = as_bytes
+        self.loop = asyncio.get_running_loop()
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def fetch(self, url: str) -> Union[str, bytes]:
+        host = urlsplit(url).netloc
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.scraper.max_concurrency_per_host)
+
+        async with self.semaphores[host]:
+            # o token só é reservado depois de obter a vaga do host: a coleta
+            # nunca tem mais que `max_concurrency_per_host` reservas em aberto,
+            # então a espera por um token não cresce com o número de URLs.
+            # A espera não ocupa threads do executor.
+            delay = await self.loop.run_in_executor(self.executor, self.scraper.reserve_token, host)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return await self.loop.run_in_executor(
+                self.executor, self.scraper.fetch_page, url, False, self.as_bytes
+            )
@@ -0,0 +1,153 @@
+from typing import List, Optional, Union
+from datetime import datetime
+import atexit
+import gzip
+import hashlib
+import itertools
+import logging
+import os
+import queue
+import threading
+
+from app.models import Offer, encode_offers
+
+# off: nada é gravado (padrão)
+# empty: só páginas de onde nenhuma oferta foi extraída
+# sample: 1 a cada SCRAPER_CAPTURE_SAMPLE_RATE páginas, mais as vazias
+# all: todas as páginas e as listas de ofertas de cada coleta
+CAPTURE_MODE = os.getenv("SCRAPER_CAPTURE", "off")
+CAPTURE_SAMPLE_RATE = int(os.getenv("SCRAPER_CAPTURE_SAMPLE_RATE", "100"))
+CAPTURE_DIR = os.getenv("SCRAPER_CAPTURE_DIR", "debug")
+CAPTURE_MAX_BYTES = int(os.getenv("SCRAPER_CAPTURE_MAX_BYTES", str(50 * 1024 * 1024)))
+
+CAPTURE_MODES = ("off", "empty", "sample", "all")
+
+
+class CaptureSink:
+    """
+    Captura opcional de páginas e ofertas para depuração.
+
+    As capturas são comprimidas com gzip e gravadas por uma thread em
+    segundo plano, então o scraping nunca espera por disco; se a fila
+    estiver cheia a captura é descartada. O diretório tem tamanho limitado
+    e os arquivos mais antigos são removidos primeiro.
+    """
+
+    def __init__(
+        self,
+        mode: str = CAPTURE_MODE,
+        sample_rate: int = CAPTURE_SAMPLE_RATE,
+        directory: str = CAPTURE_DIR,
+        max_bytes: int = CAPTURE_MAX_BYTES,
+        queue_size: int = 64
+    ):
+        if mode not in CAPTURE_MODES:
+            logging.warning(f"Modo de captura desconhecido '{mode}', captura desativada")
+            mode = "off"
+        self.mode = mode
+        self.sample_rate = max(1, sample_rate)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._pages = itertools.count()
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def should_capture_page(self, offers_count: int) -> bool:
+        if self.mode == "off":
+            return False
+        if self.mode == "all":
+            return True
+        if offers_count == 0:
+            return True
+        return self.mode == "sample" and next(self._pages) % self.sample_rate == 0
+
+    def capture_page(self, site: str, url: str, html_content: Union[str, bytes], offers_count: int) -> None:
+        """Agenda a gravação do HTML de uma página, se a política de amostragem permitir"""
+        if not self.should_capture_page(offers_count):
+            return
+        url_hash = hashlib.sha1(url.encode("utf-8")).hexdigest()[:10]
+        self._submit(f"{site}_page_{url_hash}.html.gz", html_content)
+
+    def capture_offers(self, site: str, offers: List[Offer]) -> None:
+        """Agenda a gravação das ofertas de uma coleta (somente no modo 'all', formato compacto)"""
+        if self.mode != "all" or not offers:
+            return
+        self._submit(f"{site}_offers.json.gz", encode_offers(offers))
+
+    def _submit(self, name: str, content: Union[str, bytes]) -> None:
+        stamp = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait((f"{stamp}_{name}", content))
+        except queue.Full:
+            logging.warning(f"Fila de captura cheia, descartando {name}")
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="capture-sink", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                logging.error(f"Erro ao gravar captura: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, filename: str, content: Union[str, bytes]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        with gzip.open(os.path.join(self.directory, filename), "wb", compresslevel=6) as f:
+            f.write(content)
+        self._rotate()
+
+    def _rotate(self) -> None:
+        """Remove as capturas mais antigas até o diretório caber em `max_bytes`"""
+        files = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for item in it:
+                if item.is_file() and item.name.endswith(".gz"):
+                    stat = item.stat()
+                    files.append((stat.st_mtime, stat.st_size, item.path))
+                    total += stat.st_size
+
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def flush(self) -> None:
+        """Aguarda as capturas pendentes serem gravadas"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+
+
+_sink: Optional[CaptureSink] = None
+_sink_lock = threading.Lock()
+
+
+def get_capture_sink() -> CaptureSink:
+    """Instância compartilhada do processo, configurada pelo ambiente"""
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = CaptureSink()
+            atexit.register(_sink.flush)
+        return _sink
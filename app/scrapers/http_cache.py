@@ -0,0 +1,193 @@
+from typing import Dict, List, Any, Optional, Union
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from app.models import Offer, decode_offers
+
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR", os.path.join("cache", "http"))
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def body_hash(html_content: Union[str, bytes]) -> str:
+    if isinstance(html_content, str):
+        html_content = html_content.encode("utf-8")
+    return hashlib.sha256(html_content).hexdigest()
+
+
+class HttpCache:
+    """
+    Cache HTTP em disco, indexado pela URL.
+
+    Para cada URL guarda o último corpo recebido, os headers ETag e
+    Last-Modified (usados em requisições condicionais) e as ofertas extraídas
+    daquele corpo, para que uma página que não mudou não precise passar de
+    novo por parse e extração. O tamanho total é limitado com descarte LRU
+    (pela data de último acesso de cada entrada).
+    """
+
+    evict_every = 32
+
+    def __init__(self, directory: str = HTTP_CACHE_DIR, max_bytes: int = HTTP_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _paths(self, url: str):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + ".json", base + ".html"
+
+    def _read_meta(self, url: str) -> Optional[Dict[str, Any]]:
+        meta_path, _ = self._paths(url)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, url: str, meta: Dict[str, Any]) -> None:
+        meta_path, _ = self._paths(url)
+        self._atomic_write(meta_path, json.dumps(meta, ensure_ascii=False))
+
+    @staticmethod
+    def _atomic_write(path: str, content: Union[str, bytes]) -> None:
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if isinstance(content, bytes):
+            with open(tmp_path, "wb") as f:
+                f.write(content)
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(content)
+        os.replace(tmp_path, path)
+
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        """Headers If-None-Match/If-Modified-Since para revalidar a URL"""
+        meta = self._read_meta(url)
+        if not meta:
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def read_body(self, url: str) -> Optional[bytes]:
+        """Corpo guardado para a URL (usado quando o servidor responde 304)"""
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(body_path, "rb") as f:
+                body = f.read()
+        except OSError:
+            return None
+        self._touch(meta_path, body_path)
+        return body
+
+    def read_text(self, url: str) -> Optional[str]:
+        """Corpo guardado decodificado com o charset da resposta original"""
+        body = self.read_body(url)
+        if body is None:
+            return None
+        meta = self._read_meta(url) or {}
+        try:
+            return body.decode(meta.get("encoding") or "utf-8", errors="replace")
+        except LookupError:
+            return body.decode("utf-8", errors="replace")
+
+    def store(self, url: str, body: bytes, etag: Optional[str], last_modified: Optional[str],
+              encoding: Optional[str] = None) -> None:
+        """Guarda o corpo (sem decodificar), o charset e os validadores da resposta"""
+        meta_path, body_path = self._paths(url)
+        digest = body_hash(body)
+        meta = self._read_meta(url) or {}
+        try:
+            if meta.get("body_hash") != digest or not os.path.exists(body_path):
+                self._atomic_write(body_path, body)
+            meta.update({
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "encoding": encoding,
+                "body_hash": digest
+            })
+            self._write_meta(url, meta)
+            self._touch(meta_path, body_path)
+        except OSError as e:
+            logging.error(f"Erro ao gravar cache HTTP de {url}: {e}")
+            return
+
+        with self._lock:
+            self._writes += 1
+            should_evict = (self._writes - 1) % self.evict_every == 0
+        if should_evict:
+            self.evict()
+
+    def get_offers(self, url: str, digest: str) -> Optional[List[Offer]]:
+        """Ofertas já extraídas da URL, se vieram de um corpo com o mesmo hash"""
+        meta = self._read_meta(url)
+        if meta and meta.get("offers_hash") == digest and meta.get("offer_rows") is not None:
+            return decode_offers(meta["offer_rows"])
+        return None
+
+    def put_offers(self, url: str, digest: str, offers: List[Offer]) -> None:
+        meta = self._read_meta(url) or {"url": url}
+        meta.pop("offers", None)
+        meta["offers_hash"] = digest
+        meta["offer_rows"] = [offer.to_list() for offer in offers]
+        try:
+            self._write_meta(url, meta)
+        except OSError as e:
+            logging.error(f"Erro ao gravar cache de ofertas de {url}: {e}")
+
+    @staticmethod
+    def _touch(*paths: str) -> None:
+        for path in paths:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def evict(self) -> None:
+        """Remove as entradas menos usadas até o cache caber em `max_bytes`"""
+        entries: Dict[str, List[Any]] = {}
+        total = 0
+        try:
+            with os.scandir(self.directory) as it:
+                for item in it:
+                    if not item.is_file() or item.name.endswith(".tmp"):
+                        continue
+                    stat = item.stat()
+                    key = item.name.rsplit(".", 1)[0]
+                    entry = entries.setdefault(key, [0.0, 0, []])
+                    entry[0] = max(entry[0], stat.st_mtime)
+                    entry[1] += stat.st_size
+                    entry[2].append(item.path)
+                    total += stat.st_size
+        except OSError as e:
+            logging.error(f"Erro ao listar o cache HTTP: {e}")
+            return
+
+        if total <= self.max_bytes:
+            return
+
+        for last_used, size, paths in sorted(entries.values(), key=lambda entry: entry[0]):
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+def default_http_cache() -> Optional[HttpCache]:
+    """Cache configurado pelo ambiente; HTTP_CACHE_DIR vazio desativa o cache"""
+    if not HTTP_CACHE_DIR:
+        return None
+    return HttpCache(HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES)
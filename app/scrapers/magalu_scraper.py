@@ -1,17 +1,44 @@
-from app.scrapers.base_scraper import BaseScraper
+from app import metrics
+from app.models import Offer
+from app.scrapers.base_scraper import BaseScraper, FetchScheduler, iter_async
+from app.scrapers.parse_pool import get_parse_pool
+from app.scrapers.registry import register
+from app.scrapers.rate_limit import RateLimitedError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote
+import asyncio
 import logging
 import json
-from pathlib import Path
-import random
-import time
+import os
 import re
-import requests
 
+# Termos/categorias buscados (um shard por termo, separados por vírgula) e
+# páginas percorridas por termo em cada coleta
+SEARCH_TERMS = [term.strip() for term in os.getenv("MAGALU_SEARCH_TERMS", "smartphone").split(",") if term.strip()]
+MAX_PAGES = int(os.getenv("MAGALU_MAX_PAGES", "5"))
+
+# Marcadores dos estados embutidos pela Magalu, em ordem de preferência
+STATE_MARKER_RE = re.compile(
+    r'window\.__(INITIAL|PRELOADED|APOLLO)_STATE__\s*=\s*'
+    r'|<script id="__NEXT_DATA__" type="application/json">'
+)
+STATE_PRIORITY = ["INITIAL", "PRELOADED", "APOLLO", "NEXT_DATA"]
+WHITESPACE_RE = re.compile(r"\s*")
+JSON_DECODER = json.JSONDecoder()
+
+@register
 class MagaluScraper(BaseScraper):
+    name = "magalu"
+    schedule = 2 * 60 * 60
+    weight = 2.0
+
     def __init__(self):
         super().__init__()
-        self.api_url = "https://www.magazineluiza.com.br/busca/smartphone/?page=1&sortby=price_asc"
+        self.base_url = "https://www.magazineluiza.com.br"
+        self.search_terms = list(SEARCH_TERMS)
+        self.max_pages = MAX_PAGES
+        self.max_in_flight = 4
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
             "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
@@ -23,109 +50,213 @@ class MagaluScraper(BaseScraper):
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
+    def _get_headers(self):
+        return self.headers.copy()
+
+    def build_search_url(self, term, page):
+        """Monta a URL de uma página de busca para um termo ou categoria"""
+        return f"{self.base_url}/busca/{quote(term)}/?page={page}&sortby=price_asc"
+
     def get_offers(self):
-        offers = []
-        try:
-            self.logger.info(f"Tentando scraping da Magazine Luiza: {self.api_url}")
+        offers = list(self.iter_offers())
+        self.logger.info(f"Total de ofertas encontradas na Magazine Luiza: {len(offers)}")
+
+        self.capture.capture_offers(self.name, offers)
 
-            response = requests.get(self.api_url, headers=self.headers)
-            html_content = response.text
+        return offers
+
+    def get_shards(self):
+        return list(self.search_terms)
+
+    def accepts_shard(self, shard):
+        """Qualquer termo de busca: a URL é sempre montada sobre o próprio site"""
+        return bool(shard.strip())
+
+    def iter_pages(self, shard=None, done=None):
+        terms = [shard] if shard else self.search_terms
+        return iter_async(self.crawl_pages(terms, done=done))
+
+    async def crawl_pages(self, terms, max_pages=None, max_in_flight=None, done=None):
+        """
+        Pipeline busca -> extração -> emissão das páginas de busca.
+
+        Mantém no máximo `max_in_flight` páginas em andamento, percorre cada
+        termo até `max_pages` páginas e para de avançar em um termo assim que
+        uma página volta sem produtos ou falha. Emite `(url, ofertas)` por
+        página à medida que ficam prontas; as URLs em `done` já foram
+        coletadas e são puladas sem nova busca. Uma página que falhou é
+        emitida com `None` e a primeira página vazia de um termo com `[]`
+        (nas seguintes, página vazia é só o fim dos resultados).
+        """
+        done = done or {}
+        max_pages = max_pages or self.max_pages
+        max_in_flight = max_in_flight or self.max_in_flight
+
+        pages = iter([(term, page) for term in terms for page in range(1, max_pages + 1)])
+        last_page = {term: max_pages for term in terms}
+        results = asyncio.Queue(maxsize=max_in_flight)
+
+        async def worker(scheduler, executor):
+            for term, page in pages:
+                if page > last_page[term]:
+                    continue
+
+                url = self.build_search_url(term, page)
+                if url in done:
+                    continue
+                try:
+                    body = await scheduler.fetch(url)
+                    page_offers = await self.page_offers_async(url, body, executor)
+                except RateLimitedError:
+                    raise
+                except Exception as e:
+                    self.logger.error(f"Erro durante o scraping da Magazine Luiza ({url}): {str(e)}")
+                    page_offers = None
+
+                if not page_offers:
+                    if page > last_page[term]:
+                        continue
+                    last_page[term] = page - 1
+                    if page_offers is not None:
+                        self.logger.info(f"Página sem produtos, encerrando '{term}' na página {page}")
+                        if page > 1:
+                            continue
 
-            debug_path = Path("debug")
-            debug_path.mkdir(exist_ok=True)
-            with open(debug_path / "magalu_debug.html", "w", encoding="utf-8") as f:
-                f.write(html_content)
+                await results.put((url, page_offers))
+
+        async def run_workers(workers):
+            try:
+                await asyncio.gather(*workers)
+            finally:
+                await results.put(None)
+
+        with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            scheduler = FetchScheduler(self, executor, as_bytes=get_parse_pool() is not None)
+            workers = [asyncio.ensure_future(worker(scheduler, executor)) for _ in range(max_in_flight)]
+            runner = asyncio.ensure_future(run_workers(workers))
+            try:
+                while (item := await results.get()) is not None:
+                    yield item
+                await runner
+            finally:
+                # RateLimitedError em um worker ou consumidor que parou antes:
+                # os demais são cancelados e aguardados antes de o executor
+                # fechar, sem páginas tentando agendar threads depois dele
+                for task in [runner, *workers]:
+                    task.cancel()
+                await asyncio.gather(runner, *workers, return_exceptions=True)
+
+    def extract_offers(self, html_content, page_url):
+        """Extrai as ofertas de uma página de busca da Magazine Luiza"""
+        offers = []
 
+        with metrics.stage(self.name, "parse"):
             json_data = self.extract_json_from_html(html_content)
 
-            if json_data:
-                self.logger.info("Dados JSON encontrados no HTML")
+        if json_data:
+            self.logger.info("Dados JSON encontrados no HTML")
 
-                products = self.extract_products_from_json(json_data)
+            with metrics.stage(self.name, "extract"):
+                products = self.extract_products_from_json(json_data, page_url)
 
-                if products:
-                    self.logger.info(f"Extraídos {len(products)} produtos do JSON")
-                    offers = products
+            if products:
+                self.logger.info(f"Extraídos {len(products)} produtos do JSON")
+                offers = products
 
-            if not offers:
-                self.logger.info("Tentando método tradicional de scraping")
+        if not offers:
+            self.logger.info("Tentando método tradicional de scraping")
+            with metrics.stage(self.name, "parse"):
                 soup = self.parse_html(html_content)
 
-                product_cards = soup.select("[data-testid='product-card']") or soup.select(".productCard")
+            with metrics.stage(self.name, "extract"):
+                offers = self.extract_cards(soup, page_url)
+
+        return offers
 
-                self.logger.info(f"Encontrados {len(product_cards)} cards de produtos")
+    def extract_cards(self, soup, page_url):
+        """Extrai as ofertas dos cards de produto do HTML (sem o JSON embutido)"""
+        offers = []
 
-                for card in product_cards:
-                    try:
-                        name_elem = card.select_one("[data-testid='product-title']") or card.select_one("h2")
-                        name = name_elem.get_text(strip=True) if name_elem else None
+        product_cards = soup.select("[data-testid='product-card']") or soup.select(".productCard")
 
-                        price_elem = card.select_one("[data-testid='price-value']") or card.select_one(".price-template__text")
-                        price_vista = price_elem.get_text(strip=True) if price_elem else None
+        self.logger.info(f"Encontrados {len(product_cards)} cards de produtos")
 
-                        installment_elem = card.select_one("[data-testid='installment']") or card.select_one(".price-installments")
-                        price_prazo = installment_elem.get_text(strip=True) if installment_elem else None
+        timestamp = datetime.now().isoformat()
 
-                        link_elem = card.select_one("a[href]")
-                        link = link_elem["href"] if link_elem else None
-                        if link and not link.startswith("http"):
-                            link = f"https://www.magazineluiza.com.br{link}"
+        for card in product_cards:
+            try:
+                name_elem = card.select_one("[data-testid='product-title']") or card.select_one("h2")
+                name = name_elem.get_text(strip=True) if name_elem else None
 
-                        unavailable_elem = card.select_one(".unavailableProduct") or card.select_one("[data-testid='unavailable']")
-                        disponivel = not bool(unavailable_elem)
+                price_elem = card.select_one("[data-testid='price-value']") or card.select_one(".price-template__text")
+                price_vista = price_elem.get_text(strip=True) if price_elem else None
 
-                        if name and price_vista:
-                            offer = {
-                                "nome": name,
-                                "preco_vista": price_vista,
-                                "preco_prazo": price_prazo,
-                                "disponivel": disponivel,
-                                "url": link or self.api_url,
-                                "timestamp": datetime.now().isoformat()
-                            }
-                            offers.append(offer)
-                            self.logger.info(f"Oferta encontrada: {name}")
-                    except Exception as e:
-                        self.logger.error(f"Erro ao processar card de produto: {str(e)}")
+                installment_elem = card.select_one("[data-testid='installment']") or card.select_one(".price-installments")
+                price_prazo = installment_elem.get_text(strip=True) if installment_elem else None
 
-            self.logger.info(f"Total de ofertas encontradas na Magazine Luiza: {len(offers)}")
+                link_elem = card.select_one("a[href]")
+                link = link_elem["href"] if link_elem else None
+                if link and not link.startswith("http"):
+                    link = f"{self.base_url}{link}"
 
-            if offers:
-                with open(debug_path / "magalu_offers_debug.json", "w", encoding="utf-8") as f:
-                    json.dump(offers, f, ensure_ascii=False, indent=4)
+                unavailable_elem = card.select_one(".unavailableProduct") or card.select_one("[data-testid='unavailable']")
+                disponivel = not bool(unavailable_elem)
 
-        except Exception as e:
-            self.logger.error(f"Erro durante o scraping da Magazine Luiza: {str(e)}")
+                if name and price_vista:
+                    offers.append(Offer(name, price_vista, price_prazo, disponivel, link or page_url, timestamp))
+                    self.logger.info(f"Oferta encontrada: {name}")
+            except Exception as e:
+                self.logger.error(f"Erro ao processar card de produto: {str(e)}")
 
         return offers
 
     def extract_json_from_html(self, html_content):
-        """Extrai dados JSON embutidos no HTML"""
+        """
+        Extrai dados JSON embutidos no HTML
+
+        O documento é percorrido uma única vez atrás dos marcadores de estado;
+        o JSON é decodificado a partir do marcador com `raw_decode`, que para
+        no fim do objeto, sem procurar o fechamento do <script> com regex.
+        """
         try:
-            patterns = [
-                r'window\.__INITIAL_STATE__\s*=\s*({.*?});\s*</script>',
-                r'window\.__PRELOADED_STATE__\s*=\s*({.*?});\s*</script>',
-                r'window\.__APOLLO_STATE__\s*=\s*({.*?});\s*</script>',
-                r'<script id="__NEXT_DATA__" type="application/json">(.*?)</script>'
-            ]
-
-            for pattern in patterns:
-                matches = re.findall(pattern, html_content, re.DOTALL)
-                if matches:
-                    for match in matches:
-                        try:
-                            return json.loads(match)
-                        except:
-                            continue
+            candidates = {}
+            for match in STATE_MARKER_RE.finditer(html_content):
+                name = match.group(1) or "NEXT_DATA"
+                if name == STATE_PRIORITY[0]:
+                    data = self._decode_json_at(html_content, match.end(), name)
+                    if data is not None:
+                        return data
+                    continue
+                candidates.setdefault(name, []).append(match.end())
+
+            for name in STATE_PRIORITY[1:]:
+                for start in candidates.get(name, []):
+                    data = self._decode_json_at(html_content, start, name)
+                    if data is not None:
+                        return data
 
             return None
         except Exception as e:
             self.logger.error(f"Erro ao extrair JSON do HTML: {str(e)}")
             return None
 
-    def extract_products_from_json(self, json_data):
+    @staticmethod
+    def _decode_json_at(html_content, start, name):
+        """Decodifica somente o valor JSON que começa em `start`"""
+        match = WHITESPACE_RE.match(html_content, start)
+        start = match.end()
+        if name != "NEXT_DATA" and html_content[start:start + 1] != "{":
+            return None
+        try:
+            data, _ = JSON_DECODER.raw_decode(html_content, start)
+            return data
+        except ValueError:
+            return None
+
+    def extract_products_from_json(self, json_data, page_url=None):
         """Extrai produtos de diferentes formatos de JSON"""
         products = []
+        timestamp = datetime.now().isoformat()
 
         try:
             if "results" in json_data and "products" in json_data["results"]:
@@ -148,12 +279,18 @@ class MagaluScraper(BaseScraper):
                 try:
                     name = self.extract_field(product, ["title", "name", "productTitle"])
                     price_vista = self.extract_field(product, ["price", "bestPrice", "priceValue", "sellingPrice"])
+                    price_cents = None
 
+                    # preços numéricos do JSON já viram centavos aqui, sem
+                    # precisar do parse da string de exibição depois
                     if isinstance(price_vista, (int, float)):
+                        price_cents = round(price_vista * 100)
                         price_vista = f"R$ {price_vista:.2f}".replace(".", ",")
 
                     installments = self.extract_field(product, ["installment", "installments"])
                     price_prazo = None
+                    installment_count = None
+                    installment_cents = None
 
                     if isinstance(installments, dict):
                         count = installments.get("count") or installments.get("quantity")
@@ -161,26 +298,24 @@ class MagaluScraper(BaseScraper):
 
                         if count and value:
                             if isinstance(value, (int, float)):
+                                installment_cents = round(value * 100)
                                 value = f"R$ {value:.2f}".replace(".", ",")
+                            if isinstance(count, int):
+                                installment_count = count
                             price_prazo = f"{count}x de {value}"
 
                     url = self.extract_field(product, ["url", "permalink", "link"])
                     if url and not url.startswith("http"):
-                        url = f"https://www.magazineluiza.com.br{url}"
+                        url = f"{self.base_url}{url}"
 
                     available = self.extract_field(product, ["available", "availability", "inStock"])
                     disponivel = True if available is None else bool(available)
 
                     if name and price_vista:
-                        offer = {
-                            "nome": name,
-                            "preco_vista": price_vista,
-                            "preco_prazo": price_prazo,
-                            "disponivel": disponivel,
-                            "url": url or self.api_url,
-                            "timestamp": datetime.now().isoformat()
-                        }
-                        products.append(offer)
+                        products.append(Offer(
+                            name, price_vista, price_prazo, disponivel, url or page_url, timestamp,
+                            price_cents, installment_count, installment_cents
+                        ))
                 except Exception as e:
                     self.logger.error(f"Erro ao processar produto do JSON: {str(e)}")
 
@@ -0,0 +1,88 @@
+"""
+Pool de processos opcional para parse + extração das páginas.
+
+Com SCRAPER_PARSE_PROCESSES > 0 os corpos baixados são enviados como bytes
+a processos separados, que fazem o parse e a extração enquanto o processo
+principal continua buscando páginas; as ofertas voltam à medida que cada
+página termina. Sem a variável (padrão) tudo roda em threads como antes.
+
+Processos filhos do pool prefork do Celery são daemônicos e não podem
+criar processos: use o modo em workers com `--pool=threads` ou
+`--pool=solo`. Nos demais casos o pool não é criado e o parse continua
+em thread.
+"""
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ProcessPoolExecutor
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from app import metrics
+from app.models import Offer
+
+PARSE_PROCESSES = int(os.getenv("SCRAPER_PARSE_PROCESSES", "0"))
+
+# Intervalo mínimo entre publicações das métricas de cada processo do pool
+METRICS_PUSH_INTERVAL = 10.0
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_warned = False
+
+
+def get_parse_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool compartilhado do processo, ou None quando o modo está desligado ou indisponível"""
+    global _pool, _warned
+    if PARSE_PROCESSES <= 0:
+        return None
+    with _pool_lock:
+        if _pool is not None:
+            return _pool
+        if multiprocessing.current_process().daemon:
+            if not _warned:
+                logging.warning(
+                    "SCRAPER_PARSE_PROCESSES ignorado: processo daemônico (worker prefork do Celery); "
+                    "use --pool=threads ou --pool=solo. Parse continua em thread."
+                )
+                _warned = True
+            return None
+        _pool = ProcessPoolExecutor(
+            max_workers=PARSE_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def discard_parse_pool(pool: ProcessPoolExecutor) -> None:
+    """Descarta um pool quebrado (processo filho morreu); o próximo uso cria outro"""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+_scrapers: Dict[str, Any] = {}
+_last_push = 0.0
+
+
+def extract_page(site: str, url: str, body: bytes) -> List[Offer]:
+    """Executada nos processos do pool: parse + extração de uma página"""
+    global _last_push
+    scraper = _scrapers.get(site)
+    if scraper is None:
+        # importado aqui para o processo filho carregar só o necessário
+        from app.scrapers.registry import get_scraper
+        scraper = _scrapers[site] = get_scraper(site)()
+
+    offers = scraper.extract_offers_from_bytes(body, url)
+
+    now = time.monotonic()
+    if now - _last_push >= METRICS_PUSH_INTERVAL:
+        _last_push = now
+        metrics.push_worker_metrics()
+    return offers
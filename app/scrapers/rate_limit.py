@@ -0,0 +1,204 @@
+from typing import Dict, Optional, Tuple
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import logging
+import os
+import threading
+import time
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - só o limitador local fica disponível
+    redis = None
+
+# Vazio desativa o Redis e usa o limitador local (um por processo)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://redis:6379/2")
+
+# A cada 429/503 a taxa do host cai pela metade, até este mínimo, e volta
+# a subir um pouco a cada resposta bem-sucedida
+MIN_RATE_FACTOR = 0.05
+RECOVERY_STEP = 0.05
+DEFAULT_PAUSE = 30.0
+KEY_TTL = 3600
+
+# Reserva um token do bucket do host. Tokens podem ficar negativos: cada
+# reserva recebe o tempo que falta para o seu token, então requisições
+# concorrentes saem espaçadas pela taxa em vez de todas ao mesmo tempo.
+# Retorna {reservado (0/1), espera em segundos}.
+RESERVE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'factor')
+local effective = rate * (tonumber(state[3]) or 1)
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + (now - ts) * effective)
+local wait = 0
+if tokens < 1 then
+  wait = (1 - tokens) / effective
+end
+if max_wait >= 0 and wait > max_wait then
+  return {0, tostring(wait)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return {1, tostring(wait)}
+"""
+
+# Reduz a taxa do host e esvazia o bucket até o fim da pausa
+PENALIZE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local factor = tonumber(redis.call('HGET', KEYS[1], 'factor')) or 1
+factor = math.max(tonumber(ARGV[2]), factor / 2)
+redis.call('HSET', KEYS[1], 'factor', tostring(factor), 'tokens', '0', 'ts', tostring(now + tonumber(ARGV[1])))
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return tostring(factor)
+"""
+
+REWARD_SCRIPT = """
+local factor = tonumber(redis.call('HGET', KEYS[1], 'factor'))
+if factor and factor < 1 then
+  redis.call('HSET', KEYS[1], 'factor', tostring(math.min(1, factor + tonumber(ARGV[1]))))
+end
+return 1
+"""
+
+
+class RateLimitedError(Exception):
+    """O host pediu para diminuir o ritmo (429/503) ou o bucket está esgotado"""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Limite de requisições para {host}, nova tentativa em {retry_after:.1f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Converte o header Retry-After (segundos ou data HTTP) em segundos"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class LocalRateLimiter:
+    """
+    Token bucket por host mantido em memória.
+
+    Mesmo algoritmo dos scripts Lua do `RedisRateLimiter`, mas restrito ao
+    processo atual; usado quando o Redis não está configurado ou disponível.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, Dict[str, float]] = {}
+
+    def reserve(self, host: str, rate: float, burst: int, max_wait: Optional[float] = None) -> Tuple[bool, float]:
+        with self._lock:
+            now = time.time()
+            bucket = self._buckets.setdefault(host, {"tokens": float(burst), "ts": now, "factor": 1.0})
+            effective = rate * bucket["factor"]
+            tokens = min(burst, bucket["tokens"] + (now - bucket["ts"]) * effective)
+            wait = (1 - tokens) / effective if tokens < 1 else 0.0
+            if max_wait is not None and wait > max_wait:
+                return False, wait
+            bucket["tokens"] = tokens - 1
+            bucket["ts"] = now
+            return True, wait
+
+    def penalize(self, host: str, pause: float) -> float:
+        with self._lock:
+            bucket = self._buckets.setdefault(host, {"tokens": 0.0, "ts": 0.0, "factor": 1.0})
+            bucket["factor"] = max(MIN_RATE_FACTOR, bucket["factor"] / 2)
+            bucket["tokens"] = 0.0
+            bucket["ts"] = time.time() + pause
+            return bucket["factor"]
+
+    def reward(self, host: str) -> None:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket and bucket["factor"] < 1:
+                bucket["factor"] = min(1.0, bucket["factor"] + RECOVERY_STEP)
+
+
+class RedisRateLimiter:
+    """
+    Token bucket por host compartilhado por todos os workers via Redis.
+
+    O estado de cada host fica em um hash e é atualizado por scripts Lua
+    atômicos usando o relógio do Redis. Se o Redis falhar, as chamadas caem
+    no limitador local até ele voltar.
+    """
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        self.client = redis.Redis.from_url(url, socket_timeout=2, socket_connect_timeout=2)
+        self.prefix = prefix
+        self.fallback = LocalRateLimiter()
+        self._reserve = self.client.register_script(RESERVE_SCRIPT)
+        self._penalize = self.client.register_script(PENALIZE_SCRIPT)
+        self._reward = self.client.register_script(REWARD_SCRIPT)
+        self._warned = False
+
+    def _unavailable(self, e: Exception) -> None:
+        if not self._warned:
+            logging.warning(f"Redis indisponível para o rate limit, usando limitador local: {e}")
+            self._warned = True
+
+    def reserve(self, host: str, rate: float, burst: int, max_wait: Optional[float] = None) -> Tuple[bool, float]:
+        try:
+            granted, wait = self._reserve(
+                keys=[self.prefix + host],
+                args=[rate, burst, -1 if max_wait is None else max_wait, KEY_TTL]
+            )
+        except redis.RedisError as e:
+            self._unavailable(e)
+            return self.fallback.reserve(host, rate, burst, max_wait)
+        return bool(granted), float(wait)
+
+    def penalize(self, host: str, pause: float) -> float:
+        try:
+            return float(self._penalize(keys=[self.prefix + host], args=[pause, MIN_RATE_FACTOR, KEY_TTL]))
+        except redis.RedisError as e:
+            self._unavailable(e)
+            return self.fallback.penalize(host, pause)
+
+    def reward(self, host: str) -> None:
+        try:
+            self._reward(keys=[self.prefix + host], args=[RECOVERY_STEP])
+        except redis.RedisError as e:
+            self._unavailable(e)
+            self.fallback.reward(host)
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Limitador compartilhado do processo: Redis quando configurado, senão local"""
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            if RATE_LIMIT_REDIS_URL and redis is not None:
+                _limiter = RedisRateLimiter(RATE_LIMIT_REDIS_URL)
+            else:
+                if RATE_LIMIT_REDIS_URL:
+                    logging.warning(
+                        "RATE_LIMIT_REDIS_URL configurado, mas o pacote redis não está instalado: "
+                        "usando o limitador local, que não é compartilhado entre os workers"
+                    )
+                _limiter = LocalRateLimiter()
+        return _limiter
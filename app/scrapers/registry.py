@@ -0,0 +1,69 @@
+from typing import Dict, List, Type
+import importlib
+import logging
+import os
+import threading
+
+from app.scrapers.base_scraper import BaseScraper
+
+# Módulos importados para popular o registro; outros sites podem ser
+# acrescentados pela variável SCRAPER_MODULES (separados por vírgula)
+SCRAPER_MODULES = [
+    "app.scrapers.magalu_scraper",
+    "app.scrapers.amazon_scraper",
+] + [module.strip() for module in os.getenv("SCRAPER_MODULES", "").split(",") if module.strip()]
+
+_scrapers: Dict[str, Type[BaseScraper]] = {}
+_loaded = False
+_load_lock = threading.Lock()
+
+
+def register(scraper_cls: Type[BaseScraper]) -> Type[BaseScraper]:
+    """Decorador que registra um scraper pelo seu `name`"""
+    name = scraper_cls.name
+    if name in _scrapers and _scrapers[name] is not scraper_cls:
+        raise ValueError(f"Já existe um scraper registrado como '{name}'")
+    _scrapers[name] = scraper_cls
+    return scraper_cls
+
+
+def _load() -> None:
+    global _loaded
+    with _load_lock:
+        if _loaded:
+            return
+        for module in SCRAPER_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                logging.error(f"Não foi possível carregar o módulo de scraper {module}: {e}")
+        _loaded = True
+
+
+def get_scrapers() -> Dict[str, Type[BaseScraper]]:
+    """Todos os scrapers registrados, por nome do site"""
+    _load()
+    return dict(_scrapers)
+
+
+def get_scraper(name: str) -> Type[BaseScraper]:
+    """Classe do scraper de um site; KeyError se o site não estiver registrado"""
+    _load()
+    return _scrapers[name]
+
+
+def site_names() -> List[str]:
+    return list(get_scrapers())
+
+
+def site_settings(name: str) -> Dict[str, object]:
+    """Configuração de agendamento e concorrência de um site"""
+    scraper_cls = get_scraper(name)
+    return {
+        "site": name,
+        "schedule": scraper_cls.schedule,
+        "priority": scraper_cls.priority,
+        "weight": scraper_cls.weight,
+        "max_concurrency_per_host": scraper_cls.max_concurrency_per_host,
+        "requests_per_second": scraper_cls.requests_per_second,
+    }
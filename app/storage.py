@@ -0,0 +1,784 @@
+from typing import Dict, FrozenSet, List, Any, Optional, Iterable, Iterator, Tuple
+import base64
+import re
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+
+from app import metrics
+from app.matching import MATCHING_VERSION, best_match, product_key
+from app.models import Offer
+from app.normalize import normalize_offers
+
+DATA_DIR = "data"
+DB_PATH = os.getenv("OFFERS_DB_PATH", os.path.join(DATA_DIR, "offers.db"))
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS offers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        site TEXT NOT NULL,
+        url TEXT NOT NULL,
+        nome TEXT NOT NULL,
+        preco_vista TEXT,
+        preco_prazo TEXT,
+        disponivel INTEGER NOT NULL DEFAULT 1,
+        timestamp TEXT NOT NULL,
+        UNIQUE (site, url)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_offers_site_timestamp ON offers (site, timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_offers_timestamp ON offers (timestamp)",
+    "CREATE INDEX IF NOT EXISTS idx_offers_disponivel ON offers (disponivel)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)",
+]
+
+# Colunas acrescentadas depois da criação da tabela; aplicadas com ALTER TABLE
+# em bancos já existentes
+MIGRATIONS = [
+    ("price_cents", "INTEGER"),
+    ("installment_count", "INTEGER"),
+    ("installment_cents", "INTEGER"),
+    ("content_hash", "TEXT"),
+    ("product_id", "INTEGER"),
+]
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_offers_price ON offers (price_cents)",
+    "CREATE INDEX IF NOT EXISTS idx_offers_site_price ON offers (site, price_cents)",
+    """
+    CREATE TABLE IF NOT EXISTS offer_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        site TEXT NOT NULL,
+        url TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        nome TEXT,
+        old_price_cents INTEGER,
+        new_price_cents INTEGER,
+        old_disponivel INTEGER,
+        new_disponivel INTEGER,
+        changed_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_changes_changed_at ON offer_changes (changed_at)",
+    """
+    CREATE TABLE IF NOT EXISTS scrape_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        site TEXT NOT NULL,
+        shard TEXT,
+        status TEXT NOT NULL,
+        offers INTEGER NOT NULL,
+        elapsed REAL NOT NULL,
+        recorded_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_runs_site_finished ON scrape_runs (site, recorded_at)",
+    # Ciclos das coletas por shard (planner): início do ciclo atual de cada
+    # site e início da última coleta bem-sucedida de cada shard
+    "CREATE TABLE IF NOT EXISTS scrape_cycles (site TEXT PRIMARY KEY, started_at TEXT NOT NULL)",
+    """
+    CREATE TABLE IF NOT EXISTS shard_successes (
+        site TEXT NOT NULL,
+        shard TEXT NOT NULL,
+        started_at TEXT NOT NULL,
+        PRIMARY KEY (site, shard)
+    )
+    """,
+    # Páginas já gravadas por uma tarefa de coleta ainda em andamento; uma
+    # nova tentativa da mesma tarefa (mesmo id no Celery) retoma daqui
+    """
+    CREATE TABLE IF NOT EXISTS scrape_checkpoints (
+        task_id TEXT NOT NULL,
+        page TEXT NOT NULL,
+        site TEXT NOT NULL,
+        shard TEXT,
+        offers INTEGER NOT NULL,
+        started_at TEXT NOT NULL,
+        recorded_at TEXT NOT NULL,
+        PRIMARY KEY (task_id, page)
+    )
+    """,
+    # Produtos casados entre os sites (ver app.matching); `model` guarda os
+    # tokens do modelo separados por espaço
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        brand TEXT NOT NULL,
+        storage TEXT NOT NULL,
+        model TEXT NOT NULL,
+        nome TEXT NOT NULL,
+        created_at TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_products_block ON products (brand, storage)",
+    "CREATE INDEX IF NOT EXISTS idx_offers_product ON offers (product_id)",
+]
+
+# Índice de texto das ofertas (FTS5 com conteúdo externo em `offers`):
+# acentos são ignorados (remove_diacritics) e os prefixos de 2 e 3
+# caracteres são indexados para acelerar a busca enquanto se digita.
+# Os triggers mantêm o índice em dia a cada gravação; o UPDATE só reindexa
+# quando o nome muda, então o upsert de ofertas iguais não mexe no índice.
+SEARCH_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS offers_fts USING fts5(
+        nome,
+        content='offers',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS offers_fts_insert AFTER INSERT ON offers BEGIN
+        INSERT INTO offers_fts (rowid, nome) VALUES (new.id, new.nome);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS offers_fts_delete AFTER DELETE ON offers BEGIN
+        INSERT INTO offers_fts (offers_fts, rowid, nome) VALUES ('delete', old.id, old.nome);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS offers_fts_update AFTER UPDATE OF nome ON offers
+    WHEN old.nome IS NOT new.nome BEGIN
+        INSERT INTO offers_fts (offers_fts, rowid, nome) VALUES ('delete', old.id, old.nome);
+        INSERT INTO offers_fts (rowid, nome) VALUES (new.id, new.nome);
+    END
+    """,
+]
+
+SEARCH_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+CHANGE_INSERT = """
+    INSERT INTO offer_changes (site, url, kind, nome, old_price_cents, new_price_cents,
+                               old_disponivel, new_disponivel, changed_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Ordenações aceitas por query_offers: (expressão de ordenação, direção).
+# Ofertas sem preço reconhecido ficam sempre no fim da listagem.
+SORTS = {
+    "id": ("id", "ASC"),
+    "price_asc": ("IFNULL(price_cents, 9223372036854775807)", "ASC"),
+    "price_desc": ("IFNULL(price_cents, -1)", "DESC"),
+}
+
+OFFER_COLUMNS = ["nome", "preco_vista", "preco_prazo", "disponivel", "url", "timestamp",
+                 "price_cents", "installment_count", "installment_cents", "product_id"]
+
+
+def offer_json_sql(prefix: str = "") -> str:
+    """
+    Expressão que serializa a oferta (site + OFFER_COLUMNS) em JSON no
+    próprio SQLite: as leituras da API montam a resposta direto desses
+    textos, sem passar cada linha por um dict
+    """
+    fields = []
+    for column in ["site"] + OFFER_COLUMNS:
+        value = prefix + column
+        if column == "disponivel":
+            value = f"json(CASE WHEN {value} THEN 'true' ELSE 'false' END)"
+        fields.append(f"'{column}', {value}")
+    return "json_object(" + ", ".join(fields) + ")"
+
+
+OFFER_JSON = offer_json_sql()
+
+
+class OfferStore:
+    """
+    Armazenamento das ofertas em SQLite (modo WAL).
+
+    As ofertas são gravadas em lotes com upsert por (site, url), de modo que
+    cada scraping apenas acrescenta ou atualiza linhas, e as leituras da API
+    consultam somente o que precisam através dos índices.
+    """
+
+    batch_size = 500
+
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(offers)")}
+            for column, column_type in MIGRATIONS:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE offers ADD COLUMN {column} {column_type}")
+            for statement in INDEXES:
+                conn.execute(statement)
+            has_search = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'offers_fts'"
+            ).fetchone()
+            for statement in SEARCH_SCHEMA:
+                conn.execute(statement)
+            if not has_search:
+                # banco anterior ao índice: indexa as ofertas já gravadas
+                conn.execute("INSERT INTO offers_fts (offers_fts) VALUES ('rebuild')")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('matching_version', 0)")
+            matched = conn.execute("SELECT value FROM meta WHERE key = 'matching_version'").fetchone()["value"]
+            if matched < MATCHING_VERSION:
+                self._rematch_products(conn)
+                conn.execute("UPDATE meta SET value = ? WHERE key = 'matching_version'", (MATCHING_VERSION,))
+
+    def _connection(self) -> sqlite3.Connection:
+        """Uma conexão por thread, já configurada para WAL"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def upsert_offers(self, site: str, offers: Iterable[Offer]) -> Dict[str, int]:
+        """
+        Insere ou atualiza as ofertas de um site em lotes
+
+        Cada lote é comparado com o estado anterior pelo hash de conteúdo de
+        cada oferta (por URL) e apenas as diferenças viram registros em
+        `offer_changes`. Retorna o total gravado e as contagens de mudanças.
+        """
+        sql = """
+            INSERT INTO offers (site, url, nome, preco_vista, preco_prazo, disponivel, timestamp,
+                                price_cents, installment_count, installment_cents, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (site, url) DO UPDATE SET
+                nome = excluded.nome,
+                preco_vista = excluded.preco_vista,
+                price_cents = excluded.price_cents,
+                installment_count = excluded.installment_count,
+                installment_cents = excluded.installment_cents,
+                preco_prazo = excluded.preco_prazo,
+                disponivel = excluded.disponivel,
+                timestamp = excluded.timestamp,
+                content_hash = excluded.content_hash
+        """
+        conn = self._connection()
+        summary = {"saved": 0, "new": 0, "price_changed": 0, "availability_changed": 0}
+        batch: Dict[str, Offer] = {}
+
+        def flush():
+            with metrics.stage(site, "normalize"):
+                batch_offers = normalize_offers(list(batch.values()))
+            changed_at = datetime.now().isoformat()
+            rows = []
+            changes = []
+            unmatched = []
+
+            with metrics.stage(site, "save"), conn:
+                previous = self._previous_state(conn, site, list(batch))
+                for offer in batch_offers:
+                    disponivel = int(bool(offer.disponivel))
+                    digest = content_hash(offer)
+                    rows.append((
+                        site,
+                        offer.url,
+                        offer.nome,
+                        offer.preco_vista,
+                        offer.preco_prazo,
+                        disponivel,
+                        offer.timestamp,
+                        offer.price_cents,
+                        offer.installment_count,
+                        offer.installment_cents,
+                        digest,
+                    ))
+
+                    old = previous.get(offer.url)
+                    if old is None or old["product_id"] is None or old["nome"] != offer.nome:
+                        unmatched.append(offer)
+                    if old is None:
+                        kinds = ["new"]
+                    elif old["content_hash"] == digest:
+                        continue
+                    else:
+                        kinds = []
+                        if old["price_cents"] != offer.price_cents:
+                            kinds.append("price_changed")
+                        if old["disponivel"] != disponivel:
+                            kinds.append("availability_changed")
+
+                    for kind in kinds:
+                        summary[kind] += 1
+                        changes.append((
+                            site,
+                            offer.url,
+                            kind,
+                            offer.nome,
+                            old["price_cents"] if old else None,
+                            offer.price_cents,
+                            old["disponivel"] if old else None,
+                            disponivel,
+                            changed_at,
+                        ))
+
+                conn.executemany(sql, rows)
+                conn.executemany(CHANGE_INSERT, changes)
+                self._assign_products(conn, site, unmatched)
+                self._bump_version(conn)
+
+            summary["saved"] += len(rows)
+
+        for offer in offers:
+            batch[offer.url] = offer
+            if len(batch) >= self.batch_size:
+                flush()
+                batch = {}
+
+        if batch:
+            flush()
+
+        return summary
+
+    @staticmethod
+    def _previous_state(conn: sqlite3.Connection, site: str, urls: List[str]) -> Dict[str, sqlite3.Row]:
+        placeholders = ", ".join("?" for _ in urls)
+        rows = conn.execute(
+            f"SELECT url, nome, content_hash, price_cents, disponivel, product_id FROM offers "
+            f"WHERE site = ? AND url IN ({placeholders})",
+            [site, *urls]
+        )
+        return {row["url"]: row for row in rows}
+
+    @staticmethod
+    def _assign_products(conn: sqlite3.Connection, site: str, offers: List[Offer]) -> None:
+        """
+        Liga ofertas novas, renomeadas ou ainda sem produto ao produto mais
+        parecido do mesmo bloco (marca, armazenamento), criando um produto
+        novo quando nenhum passa do limite de similaridade
+        """
+        blocks: Dict[Tuple[str, str], List[Tuple[int, FrozenSet[str]]]] = {}
+        created_at = datetime.now().isoformat()
+        updates = []
+        for offer in offers:
+            key = product_key(offer.nome)
+            if key is None:
+                continue
+            candidates = blocks.get(key.block)
+            if candidates is None:
+                candidates = blocks[key.block] = [
+                    (row["id"], frozenset(row["model"].split()))
+                    for row in conn.execute("SELECT id, model FROM products WHERE brand = ? AND storage = ?", key.block)
+                ]
+            product_id = best_match(key.model, candidates)
+            if product_id is None:
+                product_id = conn.execute(
+                    "INSERT INTO products (brand, storage, model, nome, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (key.brand, key.storage, " ".join(sorted(key.model)), offer.nome, created_at)
+                ).lastrowid
+                candidates.append((product_id, key.model))
+            updates.append((product_id, site, offer.url))
+        conn.executemany("UPDATE offers SET product_id = ? WHERE site = ? AND url = ?", updates)
+
+    @classmethod
+    def _rematch_products(cls, conn: sqlite3.Connection) -> None:
+        """Refaz o casamento de todas as ofertas com as regras atuais (novos ids de produto)"""
+        conn.execute("UPDATE offers SET product_id = NULL")
+        conn.execute("DELETE FROM products")
+        by_site: Dict[str, List[Offer]] = {}
+        for row in conn.execute("SELECT site, nome, url FROM offers ORDER BY id"):
+            by_site.setdefault(row["site"], []).append(Offer(row["nome"], None, url=row["url"]))
+        for site, offers in by_site.items():
+            cls._assign_products(conn, site, offers)
+        if by_site:
+            cls._bump_version(conn)
+
+    def mark_gone(self, site: str, seen_before: str) -> int:
+        """
+        Remove as ofertas do site que não apareceram desde `seen_before`
+        (início de uma coleta completa) e registra cada uma como 'gone'
+        """
+        conn = self._connection()
+        changed_at = datetime.now().isoformat()
+        with conn:
+            gone = conn.execute(
+                "SELECT id, url, nome, price_cents, disponivel FROM offers WHERE site = ? AND timestamp < ?",
+                (site, seen_before)
+            ).fetchall()
+            if not gone:
+                return 0
+            conn.executemany(CHANGE_INSERT, [
+                (site, row["url"], "gone", row["nome"], row["price_cents"], None, row["disponivel"], None, changed_at)
+                for row in gone
+            ])
+            conn.executemany("DELETE FROM offers WHERE id = ?", [(row["id"],) for row in gone])
+            self._bump_version(conn)
+        return len(gone)
+
+    def get_changes(
+        self,
+        since: Optional[str] = None,
+        site: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Mudanças registradas a partir de `since` (ISO 8601), paginadas por
+        id; `since` com fuso é convertido para a hora local gravada no banco
+        """
+        where = []
+        params: List[Any] = []
+        if since:
+            where.append("changed_at >= ?")
+            params.append(local_timestamp(since))
+        if site:
+            where.append("site = ?")
+            params.append(site)
+        if cursor:
+            _, last_id = _decode_cursor(cursor)
+            where.append("id > ?")
+            params.append(last_id)
+
+        sql = "SELECT * FROM offer_changes"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(None, rows[-1]["id"])
+
+        changes = []
+        for row in rows:
+            change = dict(row)
+            for key in ("old_disponivel", "new_disponivel"):
+                if change[key] is not None:
+                    change[key] = bool(change[key])
+            changes.append(change)
+        return changes, next_cursor
+
+    def record_run(self, site: str, shard: Optional[str], status: str, offers: int = 0, elapsed: float = 0.0) -> None:
+        """
+        Registra um shard despachado ('queued') ou o resultado da sua coleta;
+        usado pelo planner para escolher os shards e medir o rendimento
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO scrape_runs (site, shard, status, offers, elapsed, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (site, shard, status, offers, elapsed, datetime.now().isoformat())
+            )
+
+    def last_shard_runs(self, site: str) -> Dict[Optional[str], str]:
+        """Último despacho ou coleta bem-sucedida de cada shard do site"""
+        rows = self._connection().execute(
+            "SELECT shard, MAX(recorded_at) AS recorded_at FROM scrape_runs "
+            "WHERE site = ? AND status != 'error' GROUP BY shard",
+            (site,)
+        ).fetchall()
+        return {row["shard"]: row["recorded_at"] for row in rows}
+
+    def recent_yields(self, since: str) -> Dict[str, float]:
+        """Ofertas por segundo de coleta de cada site desde `since`"""
+        rows = self._connection().execute(
+            "SELECT site, SUM(offers) AS offers, SUM(elapsed) AS elapsed FROM scrape_runs "
+            "WHERE recorded_at >= ? AND status != 'queued' GROUP BY site",
+            (since,)
+        ).fetchall()
+        return {row["site"]: row["offers"] / max(row["elapsed"], 1.0) for row in rows}
+
+    def complete_shard(self, site: str, shard: str, started_at: str, shards: Iterable[str]) -> Optional[str]:
+        """
+        Registra a coleta bem-sucedida de um shard iniciada em `started_at`
+
+        Quando todos os `shards` do site têm uma coleta bem-sucedida iniciada
+        depois do começo do ciclo atual, o ciclo é encerrado: retorna o início
+        dele (antes disso ficam as ofertas que nenhum shard viu) e abre o
+        próximo. Enquanto o ciclo não fecha retorna None.
+        """
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT INTO shard_successes (site, shard, started_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (site, shard) DO UPDATE SET started_at = MAX(started_at, excluded.started_at)",
+                (site, shard, started_at)
+            )
+            conn.execute("INSERT OR IGNORE INTO scrape_cycles (site, started_at) VALUES (?, ?)", (site, started_at))
+            cycle_started = conn.execute(
+                "SELECT started_at FROM scrape_cycles WHERE site = ?", (site,)
+            ).fetchone()["started_at"]
+            covered = {
+                row["shard"] for row in conn.execute(
+                    "SELECT shard FROM shard_successes WHERE site = ? AND started_at >= ?", (site, cycle_started)
+                )
+            }
+            if not set(shards) <= covered:
+                return None
+            conn.execute(
+                "UPDATE scrape_cycles SET started_at = ? WHERE site = ?", (datetime.now().isoformat(), site)
+            )
+        return cycle_started
+
+    def load_checkpoint(self, task_id: str) -> Tuple[Optional[str], Dict[str, int]]:
+        """Início da primeira tentativa da tarefa e as páginas já gravadas (URL -> ofertas)"""
+        rows = self._connection().execute(
+            "SELECT page, offers, started_at FROM scrape_checkpoints WHERE task_id = ?", (task_id,)
+        ).fetchall()
+        if not rows:
+            return None, {}
+        return rows[0]["started_at"], {row["page"]: row["offers"] for row in rows}
+
+    def save_checkpoint(
+        self,
+        task_id: str,
+        site: str,
+        shard: Optional[str],
+        started_at: str,
+        pages: List[Tuple[str, int]]
+    ) -> None:
+        """Registra páginas cujas ofertas já foram gravadas"""
+        recorded_at = datetime.now().isoformat()
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO scrape_checkpoints "
+                "(task_id, page, site, shard, offers, started_at, recorded_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(task_id, page, site, shard, offers, started_at, recorded_at) for page, offers in pages]
+            )
+
+    def clear_checkpoint(self, task_id: str, stale_before: str) -> None:
+        """Apaga o checkpoint da tarefa e os de tarefas abandonadas antes de `stale_before`"""
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "DELETE FROM scrape_checkpoints WHERE task_id = ? OR recorded_at < ?",
+                (task_id, stale_before)
+            )
+
+    @staticmethod
+    def _bump_version(conn: sqlite3.Connection) -> None:
+        conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+
+    def data_version(self) -> int:
+        """Contador incrementado a cada gravação; usado para invalidar caches de leitura"""
+        row = self._connection().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row["value"] if row else 0
+
+    def iter_offers(self, site: Optional[str] = None, chunk_size: int = 1000) -> Iterator[List[str]]:
+        """
+        Percorre todas as ofertas (já em JSON) em blocos de `chunk_size`, sem
+        carregar o conjunto inteiro em memória
+
+        Cada bloco é uma consulta própria (paginada por id), então o gerador
+        pode ser consumido a partir de threads diferentes.
+        """
+        sql = f"SELECT id, {OFFER_JSON} AS offer FROM offers WHERE id > ?"
+        if site:
+            sql += " AND site = ?"
+        sql += " ORDER BY id LIMIT ?"
+
+        last_id = 0
+        while True:
+            params = [last_id, site, chunk_size] if site else [last_id, chunk_size]
+            rows = self._connection().execute(sql, params).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1]["id"]
+            yield [row["offer"] for row in rows]
+            if len(rows) < chunk_size:
+                return
+
+    def query_offers(
+        self,
+        site: Optional[str] = None,
+        disponivel: Optional[bool] = None,
+        min_price_cents: Optional[int] = None,
+        max_price_cents: Optional[int] = None,
+        name: Optional[str] = None,
+        sort: str = "id",
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[str], Optional[str]]:
+        """
+        Consulta paginada das ofertas com filtros e ordenação feitos no banco.
+
+        A paginação é por chave (keyset): o cursor guarda o valor de ordenação
+        e o id da última oferta retornada, então cada página custa o mesmo
+        independente da posição. Retorna as ofertas, já serializadas em JSON
+        pelo SQLite, e o cursor da próxima página (None quando não há mais
+        resultados).
+        """
+        if sort not in SORTS:
+            raise ValueError(f"Ordenação inválida: {sort}")
+        key, direction = SORTS[sort]
+
+        where = []
+        params: List[Any] = []
+        if site:
+            where.append("site = ?")
+            params.append(site)
+        if disponivel is not None:
+            where.append("disponivel = ?")
+            params.append(int(disponivel))
+        if min_price_cents is not None:
+            where.append("price_cents >= ?")
+            params.append(min_price_cents)
+        if max_price_cents is not None:
+            where.append("price_cents <= ?")
+            params.append(max_price_cents)
+        if name:
+            escaped = name.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            where.append("nome LIKE ? ESCAPE '\\'")
+            params.append(f"%{escaped}%")
+        if cursor:
+            last_key, last_id = _decode_cursor(cursor)
+            op = ">" if direction == "ASC" else "<"
+            where.append(f"({key} {op} ? OR ({key} = ? AND id {op} ?))")
+            params.extend([last_key, last_key, last_id])
+
+        sql = f"SELECT id, {key} AS sort_key, {OFFER_JSON} AS offer FROM offers"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {key} {direction}, id {direction} LIMIT ?"
+        params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+
+        return [row["offer"] for row in rows], next_cursor
+
+    def search_offers(
+        self,
+        query: str,
+        site: Optional[str] = None,
+        limit: int = 100,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[str], Optional[str]]:
+        """
+        Busca textual no nome das ofertas, ordenada por relevância (bm25).
+
+        Cada palavra da consulta vira um termo de prefixo e todas precisam
+        aparecer ("sams gal" encontra "Samsung Galaxy"); acentos e caixa são
+        ignorados. Paginação por chave sobre (relevância, id).
+        """
+        match = search_expression(query)
+        if not match:
+            raise ValueError("Consulta de busca vazia")
+
+        where = ["offers_fts MATCH ?"]
+        params: List[Any] = [match]
+        if site:
+            where.append("o.site = ?")
+            params.append(site)
+        if cursor:
+            last_score, last_id = _decode_cursor(cursor)
+            where.append("(bm25(offers_fts) > ? OR (bm25(offers_fts) = ? AND o.id > ?))")
+            params.extend([last_score, last_score, last_id])
+
+        sql = (
+            f"SELECT o.id, bm25(offers_fts) AS sort_key, {offer_json_sql('o.')} AS offer "
+            "FROM offers_fts JOIN offers o ON o.id = offers_fts.rowid "
+            "WHERE " + " AND ".join(where) +
+            " ORDER BY sort_key, o.id LIMIT ?"
+        )
+        params.append(limit + 1)
+
+        rows = self._connection().execute(sql, params).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+
+        return [row["offer"] for row in rows], next_cursor
+
+    def get_product_offers(self, product_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Produto casado e suas ofertas (em JSON) em todos os sites, da mais
+        barata para a mais cara; `best_offer` é a mais barata entre as
+        disponíveis
+        """
+        conn = self._connection()
+        product = conn.execute(
+            "SELECT id, brand, storage, nome FROM products WHERE id = ?", (product_id,)
+        ).fetchone()
+        if product is None:
+            return None
+
+        key, _ = SORTS["price_asc"]
+        rows = conn.execute(
+            f"SELECT disponivel, price_cents, {OFFER_JSON} AS offer FROM offers "
+            f"WHERE product_id = ? ORDER BY {key}, id",
+            (product_id,)
+        ).fetchall()
+        best = next((row["offer"] for row in rows if row["disponivel"] and row["price_cents"] is not None), None)
+        return {
+            "id": product["id"],
+            "brand": product["brand"],
+            "storage": product["storage"] or None,
+            "nome": product["nome"],
+            "best_offer": json.loads(best) if best else None,
+            "count": len(rows),
+            "offers": [row["offer"] for row in rows],
+        }
+
+
+def content_hash(offer: Offer) -> str:
+    """Hash dos campos visíveis da oferta, usado para detectar mudanças"""
+    values = (offer.nome, offer.preco_vista, offer.preco_prazo, bool(offer.disponivel))
+    raw = "\x1f".join(str(value) for value in values)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def search_expression(query: str) -> str:
+    """Converte o texto digitado em uma expressão FTS5 de prefixos"""
+    return " ".join(f'"{token}"*' for token in SEARCH_TOKEN_RE.findall(query))
+
+
+def local_timestamp(value: str) -> str:
+    """
+    Instante ISO 8601 no formato das colunas de data (hora local sem fuso);
+    valores sem fuso já são considerados locais. Levanta ValueError se inválido.
+    """
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat()
+
+
+def _encode_cursor(sort_key: Any, offer_id: int) -> str:
+    raw = json.dumps([sort_key, offer_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> Tuple[Any, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_key, offer_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_key, int(offer_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+_stores: Dict[str, OfferStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path: str = DB_PATH) -> OfferStore:
+    """Retorna a instância compartilhada do OfferStore para o caminho informado"""
+    with _stores_lock:
+        if path not in _stores:
+            logging.info(f"Abrindo armazenamento de ofertas em {path}")
+            _stores[path] = OfferStore(path)
+        return _stores[path]
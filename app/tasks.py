@@ -1,92 +1,315 @@
-from contextlib import contextmanager
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Tuple
 import os
-import json
 import logging
-from celery import Celery
+import random
+import time
+from datetime import datetime, timedelta
+from celery import Celery, chord
+from celery.signals import task_postrun, worker_process_shutdown
 
-from app.scrapers.magalu_scraper import MagaluScraper
-from app.scrapers.amazon_scraper import AmazonScraper
+from app import metrics
+from app.scrapers.rate_limit import RateLimitedError
+from app.scrapers.registry import get_scraper, get_scrapers
+from app.history import get_history
+from app.models import Offer
+from app.planner import PLANNER_INTERVAL, plan_scrapes
+from app.storage import get_store
 
-celery_app = Celery("tasks", broker="redis://redis:6379/0")
+celery_app = Celery(
+    "tasks",
+    broker="redis://redis:6379/0",
+    backend="redis://redis:6379/1"
+)
+
+# Um único pool de conexões Redis por processo, compartilhado entre as
+# publicações da API (producer pool) e o backend de resultados
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "20"))
+celery_app.conf.update(
+    broker_pool_limit=REDIS_MAX_CONNECTIONS,
+    broker_transport_options={"max_connections": REDIS_MAX_CONNECTIONS},
+    redis_max_connections=REDIS_MAX_CONNECTIONS
+)
+
+celery_app.conf.beat_schedule = {
+    "plan-scrapes": {
+        "task": "app.tasks.dispatch_due_scrapes",
+        "schedule": PLANNER_INTERVAL
+    },
+    "compact-price-history": {
+        "task": "app.tasks.compact_price_history",
+        "schedule": 24 * 60 * 60
+    }
+}
 
 logging.basicConfig(level=logging.INFO)
 
-DATA_DIR = "data"
-if not os.path.exists(DATA_DIR):
-    os.makedirs(DATA_DIR)
+# Novas tentativas de coletas bloqueadas pelo rate limit (429/503)
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 15 * 60
+MAX_RETRIES = 5
+
+# Ofertas acumuladas durante a coleta antes de cada gravação (e checkpoint)
+SAVE_BATCH_SIZE = int(os.getenv("SCRAPE_SAVE_BATCH_SIZE", "500"))
+
+# Checkpoints de tarefas que nunca foram retomadas são descartados depois disso
+CHECKPOINT_TTL = timedelta(days=1)
 
-@contextmanager
-def json_file_handler(filename: str, mode: str = "a"):
-    """Context manager para manipulação segura de arquivos JSON"""
-    filepath = os.path.join(DATA_DIR, filename)
+@task_postrun.connect
+@worker_process_shutdown.connect
+def export_metrics(**kwargs):
+    """Publica as métricas do worker para o /metrics da API"""
+    metrics.push_worker_metrics()
+
+def save_offers(offers: List[Offer], site: str) -> Dict[str, int]:
+    """Grava as ofertas de um site e retorna as contagens de mudanças detectadas"""
     try:
-        with open(filepath, mode, encoding="utf-8") as f:
-            yield f
+        changes = get_store().upsert_offers(site, offers)
+        get_history().append(site, offers)
+        logging.info(
+            f"{changes['saved']} ofertas de {site} salvas com sucesso "
+            f"({changes['new']} novas, {changes['price_changed']} com preço alterado, "
+            f"{changes['availability_changed']} com disponibilidade alterada)"
+        )
+        return changes
     except Exception as e:
-        logging.error(f"Erro ao manipular arquivo {filename}: {e}")
+        logging.error(f"Erro ao salvar ofertas de {site}: {e}")
         raise
 
-def save_offers(offers: List[Dict[str, Any]], filename: str) -> None:
-    """Salva as ofertas em um arquivo JSON"""
-    try:
-        os.makedirs(DATA_DIR, exist_ok=True)
+def retry_countdown(retries: int, retry_after: Optional[float] = None) -> float:
+    """Atraso exponencial com jitter, nunca menor que o Retry-After do host"""
+    ceiling = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** retries)
+    delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+    return round(max(delay, retry_after or 0), 1)
 
-        filepath = os.path.join(DATA_DIR, filename)
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(offers, f, ensure_ascii=False, indent=2)
+def retry_rate_limited(task, error: RateLimitedError) -> None:
+    """Reagenda a tarefa em vez de dormir no worker; não retorna se ainda houver tentativas"""
+    if task.request.retries >= task.max_retries:
+        logging.error(f"{error} (tentativas esgotadas)")
+        return
+    countdown = retry_countdown(task.request.retries, error.retry_after)
+    logging.warning(f"{error}; tarefa {task.name} reagendada em {countdown}s")
+    raise task.retry(exc=error, countdown=countdown)
 
-        logging.info(f"Ofertas salvas com sucesso em {filename}")
+def finish_full_run(site: str, run_started: str) -> int:
+    """Marca como 'gone' as ofertas que não apareceram em uma coleta completa"""
+    gone = get_store().mark_gone(site, run_started)
+    if gone:
+        logging.info(f"{gone} ofertas de {site} não apareceram mais na coleta")
+    return gone
+
+def finish_shard_cycle(site: str, shard: str, run_started: str, shards: List[str]) -> Optional[int]:
+    """
+    Conta a coleta bem-sucedida do shard no ciclo do site; quando ela fecha
+    o ciclo (todos os shards coletados com sucesso desde o início dele),
+    marca como 'gone' as ofertas que nenhum shard viu no ciclo
+    """
+    cycle_started = get_store().complete_shard(site, shard, run_started, shards)
+    if cycle_started is None:
+        return None
+    logging.info(f"Ciclo de coleta de {site} completo ({len(shards)} shards desde {cycle_started})")
+    return finish_full_run(site, cycle_started)
+
+def clear_checkpoint(task_id: Optional[str]) -> None:
+    """Descarta o checkpoint de uma tarefa encerrada e os de tarefas abandonadas"""
+    if not task_id:
+        return
+    try:
+        get_store().clear_checkpoint(task_id, (datetime.now() - CHECKPOINT_TTL).isoformat())
     except Exception as e:
-        logging.error(f"Erro ao salvar ofertas em {filename}: {e}")
-        raise
+        logging.error(f"Erro ao apagar o checkpoint da tarefa {task_id}: {e}")
 
-@celery_app.task
-def scrape_magalu_offers():
-    """Tarefa para coletar ofertas da Magazine Luiza"""
+@celery_app.task(bind=True, max_retries=MAX_RETRIES, acks_late=True, reject_on_worker_lost=True)
+def scrape_site(self, site: str, shard: Optional[str] = None):
+    """
+    Tarefa que coleta um shard de um site (uma URL ou termo de busca)
+
+    Sem `shard` executa a coleta completa do site. As ofertas são gravadas
+    em lotes à medida que as páginas chegam, e cada lote gravado entra no
+    checkpoint da tarefa: uma nova tentativa (rate limit) ou a reentrega
+    após a queda do worker pula as páginas já gravadas. Se o host limitar
+    as requisições a tarefa é reagendada com atraso exponencial; esgotadas
+    as tentativas, o shard entra no resumo como erro. Páginas que falharam
+    ou vieram vazias deixam a coleta como 'warning': só uma coleta
+    'success' pode marcar ofertas como 'gone'. Coletas por shard (as do
+    planner) fazem isso quando fecham o ciclo de shards do site.
+    """
+    started = time.monotonic()
+    task_id = self.request.id
     try:
-        logging.info("Iniciando scraping Magazine Luiza")
-        scraper = MagaluScraper()
-        offers = scraper.get_offers()
-
-        if offers:
-            save_offers(offers, "magalu_offers.json")
-            logging.info(f"Scraping Magazine Luiza finalizado: {len(offers)} ofertas coletadas")
-            return {"status": "success", "count": len(offers)}
+        store = get_store()
+        run_started, done = store.load_checkpoint(task_id) if task_id else (None, {})
+        # a coleta completa usa o início da primeira tentativa para achar as ofertas que sumiram
+        run_started = run_started or datetime.now().isoformat()
+        if done:
+            logging.info(f"Retomando scraping {site} (shard: {shard}): {len(done)} páginas já gravadas")
         else:
-            logging.warning("Nenhuma oferta encontrada na Magazine Luiza")
-            return {"status": "warning", "count": 0}
+            logging.info(f"Iniciando scraping {site} (shard: {shard})")
+        scraper = get_scraper(site)()
+        if shard is not None and not scraper.accepts_shard(shard):
+            raise ValueError(f"Shard inválido para {site}: {shard}")
+
+        changes: Dict[str, int] = {}
+        scraped = 0
+        batch: List[Offer] = []
+        pages: List[Tuple[str, int]] = []
+        failed_pages: List[str] = []
+        empty_pages: List[str] = []
+
+        def flush():
+            for kind, count in save_offers(batch, site).items():
+                changes[kind] = changes.get(kind, 0) + count
+            scraper.capture.capture_offers(site, batch)
+            if task_id:
+                store.save_checkpoint(task_id, site, shard, run_started, pages)
+            batch.clear()
+            pages.clear()
+
+        try:
+            for url, page_offers in scraper.iter_pages(shard, done):
+                # páginas com erro ou vazias não entram no checkpoint: são buscadas de novo
+                if page_offers is None:
+                    failed_pages.append(url)
+                    continue
+                if not page_offers:
+                    empty_pages.append(url)
+                    continue
+                batch.extend(page_offers)
+                pages.append((url, len(page_offers)))
+                scraped += len(page_offers)
+                if len(batch) >= SAVE_BATCH_SIZE:
+                    flush()
+        except RateLimitedError:
+            # grava o lote parcial antes de a tarefa ser reagendada, para a
+            # nova tentativa retomar depois dessas páginas
+            if batch:
+                flush()
+            raise
+        if batch:
+            flush()
+
+        total = scraped + sum(done.values())
+        complete = bool(total) and not failed_pages and not empty_pages
+        if failed_pages or empty_pages:
+            logging.warning(
+                f"Coleta {site} (shard: {shard}) incompleta: {len(failed_pages)} páginas com erro "
+                f"e {len(empty_pages)} sem ofertas"
+            )
+        if complete and shard is None:
+            changes["gone"] = finish_full_run(site, run_started)
+        elif complete:
+            gone = finish_shard_cycle(site, shard, run_started, scraper.get_shards())
+            if gone is not None:
+                changes["gone"] = gone
+        status = "success" if complete else "warning"
+        elapsed = round(time.monotonic() - started, 3)
+        store.record_run(site, shard, status, scraped, elapsed)
+        clear_checkpoint(task_id)
+        return {
+            "site": site,
+            "shard": shard,
+            "status": status,
+            "count": total,
+            "failed_pages": len(failed_pages),
+            "empty_pages": len(empty_pages),
+            "changes": changes,
+            "elapsed": elapsed
+        }
 
     except Exception as e:
-        logging.error(f"Erro no scraping Magazine Luiza: {str(e)}")
-        return {"status": "error", "message": str(e)}
+        if isinstance(e, RateLimitedError):
+            retry_rate_limited(self, e)
+        metrics.record_failure(site, type(e).__name__)
+        logging.error(f"Erro no scraping {site} (shard: {shard}): {str(e)}")
+        elapsed = round(time.monotonic() - started, 3)
+        try:
+            get_store().record_run(site, shard, "error", 0, elapsed)
+        except Exception as store_error:
+            logging.error(f"Erro ao registrar a coleta de {site}: {store_error}")
+        clear_checkpoint(task_id)
+        return {
+            "site": site,
+            "shard": shard,
+            "status": "error",
+            "message": str(e),
+            "count": 0,
+            "elapsed": elapsed
+        }
 
 @celery_app.task
-def scrape_amazon_offers():
-    try:
-        logging.info("Iniciando scraping Amazon")
-        scraper = AmazonScraper()
-        offers = scraper.get_offers()
-
-        if offers:
-            save_offers(offers, "amazon_offers.json")
-            logging.info(f"Scraping Amazon finalizado: {len(offers)} ofertas coletadas")
-            return {"status": "success", "count": len(offers)}
-        else:
-            logging.warning("Nenhuma oferta encontrada na Amazon")
-            return {"status": "warning", "count": 0}
+def summarize_scrape(results: List[Dict[str, Any]], started_at: float):
+    """Callback do scrape_all: consolida contagens e tempos por site"""
+    sites: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        summary = sites.setdefault(result["site"], {
+            "count": 0,
+            "shards": 0,
+            "errors": 0,
+            "incomplete": 0,
+            "slowest_shard": 0.0,
+            "total_shard_time": 0.0
+        })
+        summary["count"] += result["count"]
+        for kind, count in result.get("changes", {}).items():
+            if kind != "saved":
+                summary.setdefault("changes", {}).setdefault(kind, 0)
+                summary["changes"][kind] += count
+        summary["shards"] += 1
+        summary["errors"] += result["status"] == "error"
+        summary["incomplete"] += result["status"] != "success"
+        summary["slowest_shard"] = max(summary["slowest_shard"], result["elapsed"])
+        summary["total_shard_time"] = round(summary["total_shard_time"] + result["elapsed"], 3)
 
-    except Exception as e:
-        logging.error(f"Erro no scraping Amazon: {str(e)}")
-        return {"status": "error", "message": str(e)}
+    # só uma coleta em que todos os shards terminaram com 'success' pode
+    # concluir que ofertas sumiram
+    run_started = datetime.fromtimestamp(started_at).isoformat()
+    for site, summary in sites.items():
+        if summary["incomplete"] == 0 and summary["count"] > 0:
+            summary.setdefault("changes", {})["gone"] = finish_full_run(site, run_started)
+
+    elapsed = round(time.time() - started_at, 3)
+    for site, summary in sites.items():
+        logging.info(f"Scraping {site} finalizado: {summary['count']} ofertas em {summary['shards']} shards")
+    logging.info(f"Scraping completo finalizado em {elapsed}s")
+    return {"elapsed": elapsed, "sites": sites}
 
 @celery_app.task
 def scrape_all():
     """
     Tarefa para executar o scraping em todos os sites
+
+    Dispara um subtarefa por site e shard em paralelo (chord); o resumo
+    com contagens e tempos por site é produzido por `summarize_scrape`.
     """
-    results = {
-        "magalu": scrape_magalu_offers(),
-        "amazon": scrape_amazon_offers()
-    }
-    return results
\ No newline at end of file
+    shards = [
+        scrape_site.s(site, shard).set(priority=scraper_cls.priority)
+        for site, scraper_cls in get_scrapers().items()
+        for shard in scraper_cls().get_shards() or [None]
+    ]
+    result = chord(shards)(summarize_scrape.s(time.time()))
+    logging.info(f"Scraping completo disparado com {len(shards)} shards")
+    return {"status": "dispatched", "shards": len(shards), "summary_task_id": result.id}
+
+@celery_app.task
+def dispatch_due_scrapes():
+    """
+    Planner executado pelo beat: despacha os shards vencidos de cada site,
+    dividindo a capacidade pelo peso e pelo rendimento recente dos sites
+    """
+    store = get_store()
+    planned = plan_scrapes()
+    for site, shard in planned:
+        scrape_site.apply_async((site, shard), priority=get_scraper(site).priority)
+        store.record_run(site, shard, "queued")
+
+    per_site: Dict[str, int] = {}
+    for site, _ in planned:
+        per_site[site] = per_site.get(site, 0) + 1
+    if planned:
+        logging.info(f"Planner despachou {len(planned)} shards: {per_site}")
+    return {"dispatched": len(planned), "sites": per_site}
+
+@celery_app.task
+def compact_price_history():
+    """Reduz os segmentos antigos do histórico de preços (executada pelo beat)"""
+    compacted = get_history().compact()
+    return {"status": "success", "segments": compacted}
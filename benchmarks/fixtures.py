@@ -0,0 +1,140 @@
+"""
+Páginas usadas pelos benchmarks.
+
+Por padrão as páginas são sintéticas, geradas de forma determinística com
+a mesma estrutura que os scrapers esperam (cards de busca da Amazon e o
+JSON __NEXT_DATA__ da Magalu) e com marcação de preenchimento para chegar
+a tamanhos parecidos com os reais. Capturas gravadas pelo modo de
+depuração (`SCRAPER_CAPTURE`, arquivos `*_{site}_page_*.html.gz`) podem
+ser reproduzidas no lugar delas.
+"""
+from typing import Dict, List, Tuple
+import glob
+import gzip
+import json
+import os
+import random
+
+AMAZON_BASE = "https://www.amazon.com.br"
+MAGALU_BASE = "https://www.magazineluiza.com.br"
+
+BRANDS = ["Samsung", "Apple", "Motorola", "Xiaomi", "LG", "Philips", "Lenovo", "Dell", "Sony", "Multilaser"]
+PRODUCTS = ["Smartphone", "Notebook", "Smart TV", "Fone de Ouvido", "Tablet", "Monitor", "Air Fryer", "Caixa de Som"]
+VARIANTS = ["128GB", "256GB", "8GB RAM", "55 Polegadas", "Bluetooth", "Preto", "Azul", "4K", "Wi-Fi", "Bivolt"]
+
+Page = Tuple[str, str]
+
+
+def _format_brl(cents: int) -> str:
+    reais, rest = divmod(cents, 100)
+    return f"R$ {reais:,}".replace(",", ".") + f",{rest:02d}"
+
+
+def _product(rng: random.Random, index: int) -> Dict[str, object]:
+    name = f"{rng.choice(PRODUCTS)} {rng.choice(BRANDS)} {' '.join(rng.sample(VARIANTS, 2))} {index}"
+    cents = rng.randint(2_990, 899_990)
+    count = rng.choice([1, 2, 3, 5, 6, 10, 12])
+    return {
+        "name": name,
+        "cents": cents,
+        "count": count,
+        "installment_cents": -(-cents // count),
+        "available": rng.random() > 0.1,
+        "sku": f"{index:08d}{rng.randint(0, 9999):04d}",
+    }
+
+
+def _filler(rng: random.Random, blocks: int) -> str:
+    """Marcação sem produtos (menus, scripts, banners), como nas páginas reais"""
+    parts = []
+    for i in range(blocks):
+        parts.append(
+            f'<div class="nav-menu-item" data-ref="nav_{i}"><a href="/b/{rng.randint(1, 99999)}">'
+            f'<span class="nav-a-content">Categoria {i}</span></a></div>'
+        )
+        if i % 10 == 0:
+            parts.append(f"<script>window.ue_t{i}={rng.random()};var p{i}={{\"k\":\"{'x' * 200}\"}};</script>")
+    return "\n".join(parts)
+
+
+def amazon_page(seed: int, products: int = 48, filler_blocks: int = 400) -> str:
+    rng = random.Random(seed)
+    cards = []
+    for i in range(products):
+        p = _product(rng, seed * 1000 + i)
+        unavailable = "" if p["available"] else '<span class="a-color-price unavailablePrice">Indisponível</span>'
+        cards.append(f"""
+<div data-component-type="s-search-result" data-asin="B0{p['sku']}" class="s-result-item s-asin sg-col-4-of-24">
+  <div class="sg-col-inner"><div class="s-widget-container s-spacing-small">
+    <div class="a-section a-spacing-base">
+      <span class="rush-component"><a class="a-link-normal s-no-outline" href="/dp/B0{p['sku']}/ref=sr_1_{i}">
+        <img class="s-image" src="https://m.media-amazon.com/images/I/{p['sku']}.jpg" alt=""></a></span>
+      <h2 class="a-size-mini a-spacing-none a-color-base"><a class="a-link-normal a-text-normal" href="/dp/B0{p['sku']}">
+        <span class="a-size-base-plus a-color-base a-text-normal">{p['name']}</span></a></h2>
+      <div class="a-row a-size-base a-color-base">
+        <span class="a-price" data-a-size="xl"><span class="a-offscreen">{_format_brl(p['cents'])}</span>
+          <span aria-hidden="true"><span class="a-price-symbol">R$</span><span class="a-price-whole">{p['cents'] // 100}<span class="a-price-decimal">,</span></span><span class="a-price-fraction">{p['cents'] % 100:02d}</span></span></span>
+      </div>
+      <div class="a-row"><span class="a-size-small a-color-base">em até {p['count']}x {_format_brl(p['installment_cents'])} sem juros</span></div>
+      {unavailable}
+    </div>
+  </div></div>
+</div>""")
+    return (
+        "<!doctype html><html lang=\"pt-br\"><head><meta charset=\"utf-8\"><title>Amazon.com.br</title></head><body>"
+        f"<header>{_filler(rng, filler_blocks // 2)}</header>"
+        f"<div class=\"s-main-slot s-result-list\">{''.join(cards)}</div>"
+        f"<footer>{_filler(rng, filler_blocks // 2)}</footer></body></html>"
+    )
+
+
+def magalu_page(seed: int, products: int = 60, filler_blocks: int = 300) -> str:
+    rng = random.Random(seed)
+    items = []
+    for i in range(products):
+        p = _product(rng, seed * 1000 + i)
+        items.append({
+            "id": p["sku"],
+            "title": p["name"],
+            "price": p["cents"] / 100,
+            "installment": {"count": p["count"], "value": p["installment_cents"] / 100},
+            "url": f"/produto/{p['sku']}/p/",
+            "available": p["available"],
+            "image": f"https://a-static.mlcdn.com.br/{p['sku']}.jpg",
+            "rating": {"score": round(rng.uniform(3, 5), 1), "count": rng.randint(0, 5000)},
+            "seller": {"id": "magazineluiza", "name": "Magazine Luiza"},
+            "attributes": [{"type": "voltage", "values": ["Bivolt"]}],
+        })
+    next_data = {
+        "props": {"pageProps": {"searchResult": {"products": items, "pagination": {"page": seed, "size": products}}}},
+        "page": "/busca/[term]",
+        "buildId": "bench",
+    }
+    return (
+        "<!doctype html><html lang=\"pt-BR\"><head><meta charset=\"utf-8\"><title>Magazine Luiza</title>"
+        f"<script>window.dataLayer=[{json.dumps({'event': 'pageview', 'seed': seed})}];</script></head><body>"
+        f"{_filler(rng, filler_blocks)}"
+        "<div id=\"__next\"></div>"
+        f"<script id=\"__NEXT_DATA__\" type=\"application/json\">{json.dumps(next_data, ensure_ascii=False)}</script>"
+        "</body></html>"
+    )
+
+
+def synthetic_pages(pages: int) -> Dict[str, List[Page]]:
+    """`pages` páginas sintéticas por site, como (url, html)"""
+    return {
+        "amazon": [(f"{AMAZON_BASE}/s?k=ofertas&page={i}", amazon_page(i)) for i in range(1, pages + 1)],
+        "magalu": [(f"{MAGALU_BASE}/busca/smartphone/?page={i}", magalu_page(i)) for i in range(1, pages + 1)],
+    }
+
+
+def captured_pages(directory: str) -> Dict[str, List[Page]]:
+    """Páginas gravadas pelo CaptureSink (`*_{site}_page_*.html.gz`)"""
+    pages: Dict[str, List[Page]] = {"amazon": [], "magalu": []}
+    for path in sorted(glob.glob(os.path.join(directory, "*_page_*.html.gz"))):
+        name = os.path.basename(path)
+        for site, base in (("amazon", AMAZON_BASE), ("magalu", MAGALU_BASE)):
+            if f"_{site}_page_" in name:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    pages[site].append((f"{base}/captura/{name}", f.read()))
+    return pages
@@ -0,0 +1,276 @@
+"""
+Benchmark do pipeline de scraping, armazenamento e leitura da API.
+
+Reproduz páginas sintéticas (ou capturadas) sem acesso à rede e mede cada
+etapa separadamente: páginas/s, ofertas/s, pico de memória (tracemalloc)
+e tempo por etapa. Os resultados podem ser gravados como baseline e
+comparados em execuções seguintes.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --pages 40 --save benchmarks/baseline.json
+    python -m benchmarks.run --baseline benchmarks/baseline.json
+    python -m benchmarks.run --fixtures debug/
+"""
+from typing import Any, Callable, Dict, List, Optional
+from unittest import mock
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks.fixtures import captured_pages, synthetic_pages
+
+
+def configure_environment(workdir: str) -> None:
+    """Isola o benchmark: banco e histórico temporários, sem cache HTTP, Redis ou capturas"""
+    os.environ["OFFERS_DB_PATH"] = os.path.join(workdir, "offers.db")
+    os.environ["PRICE_HISTORY_DIR"] = os.path.join(workdir, "history")
+    os.environ["HTTP_CACHE_DIR"] = ""
+    os.environ["RATE_LIMIT_REDIS_URL"] = ""
+    os.environ["SCRAPER_CAPTURE"] = "off"
+
+
+class FakeResponse:
+    """Resposta mínima usada no lugar do requests para a página gravada"""
+
+    status_code = 200
+    headers: Dict[str, str] = {}
+
+    def __init__(self, text: str):
+        self.text = text
+        self.content = text.encode("utf-8")
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+def measure(stage: str, run: Callable[[], int], pages: int, repeat: int) -> Dict[str, Any]:
+    """
+    Executa `run` `repeat` vezes medindo o tempo e mais uma vez sob
+    tracemalloc para o pico de memória (o rastreamento distorce o tempo,
+    por isso as duas medições são separadas). `run` retorna o número de
+    ofertas processadas.
+    """
+    times = []
+    offers = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        offers = run()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    best = min(times)
+    return {
+        "stage": stage,
+        "pages": pages,
+        "offers": offers,
+        "best_s": round(best, 6),
+        "median_s": round(statistics.median(times), 6),
+        "pages_per_s": round(pages / best, 2) if best and pages else None,
+        "offers_per_s": round(offers / best, 2) if best else None,
+        "peak_kb": round(peak / 1024, 1),
+    }
+
+
+def run_benchmarks(pages: Dict[str, List], repeat: int) -> List[Dict[str, Any]]:
+    # importados só depois de configure_environment
+    from fastapi.testclient import TestClient
+
+    from app.cache import response_cache
+    from app.main import app
+    from app.models import Offer
+    from app.normalize import normalize_offers
+    from app.scrapers.amazon_scraper import AmazonScraper
+    from app.scrapers.magalu_scraper import MagaluScraper
+    from app.storage import get_store
+
+    results = []
+    amazon_pages = pages["amazon"]
+    magalu_pages = pages["magalu"]
+
+    amazon = AmazonScraper()
+    amazon.requests_per_second = 1e9
+    amazon.burst = 1_000_000
+    magalu = MagaluScraper()
+
+    if amazon_pages:
+        bodies = dict(amazon_pages)
+
+        def amazon_get_offers():
+            amazon.urls = list(bodies)
+            with mock.patch.object(amazon.session, "get", lambda url, **kwargs: FakeResponse(bodies[url])):
+                return len(amazon.get_offers())
+
+        def amazon_extract():
+            return sum(len(amazon.extract_offers(html, url)) for url, html in amazon_pages)
+
+        results.append(measure("amazon.get_offers", amazon_get_offers, len(amazon_pages), repeat))
+        results.append(measure("amazon.extract_offers", amazon_extract, len(amazon_pages), repeat))
+
+    if magalu_pages:
+        def magalu_extract_json():
+            return sum(1 for _, html in magalu_pages if magalu.extract_json_from_html(html) is not None)
+
+        documents = [(url, magalu.extract_json_from_html(html)) for url, html in magalu_pages]
+
+        def magalu_extract_products():
+            return sum(len(magalu.extract_products_from_json(data, url)) for url, data in documents if data)
+
+        results.append(measure("magalu.extract_json_from_html", magalu_extract_json, len(magalu_pages), repeat))
+        results.append(measure("magalu.extract_products_from_json", magalu_extract_products, len(magalu_pages), repeat))
+
+    # ofertas extraídas uma única vez, reaproveitadas pelas etapas seguintes
+    site_offers = {
+        "amazon": [offer for url, html in amazon_pages for offer in amazon.extract_offers(html, url)],
+        "magalu": [offer for url, data in documents for offer in magalu.extract_products_from_json(data, url)]
+        if magalu_pages else [],
+    }
+    total_offers = sum(len(offers) for offers in site_offers.values())
+    total_pages = len(amazon_pages) + len(magalu_pages)
+
+    def normalize():
+        return sum(
+            len(normalize_offers([Offer(*offer.to_list()) for offer in offers]))
+            for offers in site_offers.values()
+        )
+
+    results.append(measure("normalize_offers", normalize, total_pages, repeat))
+
+    store = get_store()
+
+    def upsert():
+        return sum(store.upsert_offers(site, offers)["saved"] for site, offers in site_offers.items() if offers)
+
+    results.append(measure("storage.upsert_offers", upsert, total_pages, repeat))
+
+    client = TestClient(app)
+
+    def api_read(limit: int = 100):
+        """Percorre todas as páginas de /offers com o cache de respostas vazio"""
+        response_cache.clear()
+        read = 0
+        cursor = None
+        while True:
+            params = {"limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            body = client.get("/offers", params=params).json()
+            read += body["count"]
+            cursor = body["next_cursor"]
+            if not cursor:
+                return read
+
+    def api_read_cached():
+        return client.get("/offers", params={"limit": 100}).json()["count"]
+
+    api_pages = -(-total_offers // 100)
+    results.append(measure("api.GET /offers (cold)", api_read, api_pages, repeat))
+    api_read_cached()
+    results.append(measure("api.GET /offers (cached)", api_read_cached, 1, repeat))
+    return results
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> bool:
+    """Imprime a variação de cada etapa em relação ao baseline; False se alguma piorou além do limite"""
+    previous = {item["stage"]: item for item in baseline.get("results", [])}
+    ok = True
+    print()
+    print(f"{'etapa':<38} {'baseline (s)':>13} {'atual (s)':>11} {'variação':>9}")
+    for item in results:
+        before = previous.get(item["stage"])
+        if not before or not before["best_s"]:
+            print(f"{item['stage']:<38} {'-':>13} {item['best_s']:>11.4f} {'novo':>9}")
+            continue
+        change = item["best_s"] / before["best_s"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  <- regressão"
+            ok = False
+        print(f"{item['stage']:<38} {before['best_s']:>13.4f} {item['best_s']:>11.4f} {change:>+9.1%}{flag}")
+    return ok
+
+
+def print_results(results: List[Dict[str, Any]]) -> None:
+    print(f"{'etapa':<38} {'páginas':>7} {'ofertas':>8} {'melhor (s)':>11} {'mediana (s)':>12} "
+          f"{'págs/s':>9} {'ofertas/s':>10} {'pico (KB)':>10}")
+    for item in results:
+        print(
+            f"{item['stage']:<38} {item['pages']:>7} {item['offers']:>8} {item['best_s']:>11.4f} "
+            f"{item['median_s']:>12.4f} {item['pages_per_s'] or 0:>9.1f} {item['offers_per_s'] or 0:>10.1f} "
+            f"{item['peak_kb']:>10.1f}"
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark dos scrapers, do armazenamento e da API")
+    parser.add_argument("--pages", type=int, default=20, help="Páginas sintéticas por site (padrão 20)")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetições cronometradas por etapa (padrão 5)")
+    parser.add_argument("--fixtures", help="Diretório com capturas *.html.gz (SCRAPER_CAPTURE) no lugar das páginas sintéticas")
+    parser.add_argument("--save", help="Grava os resultados em JSON (para usar como baseline)")
+    parser.add_argument("--baseline", help="Compara com um JSON gravado anteriormente por --save")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Piora relativa tolerada antes de falhar (padrão 0.2)")
+    parser.add_argument("--verbose", action="store_true", help="Mantém os logs INFO dos scrapers (mais lento)")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    if args.fixtures:
+        pages = captured_pages(args.fixtures)
+        if not any(pages.values()):
+            print(f"Nenhuma captura encontrada em {args.fixtures}", file=sys.stderr)
+            return 2
+    else:
+        pages = synthetic_pages(args.pages)
+
+    save_path = os.path.abspath(args.save) if args.save else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="offers-bench-") as workdir:
+        configure_environment(workdir)
+        # app.tasks cria ./data ao ser importado; mantém isso no diretório temporário
+        os.chdir(workdir)
+        try:
+            results = run_benchmarks(pages, args.repeat)
+        finally:
+            os.chdir(cwd)
+
+    print_results(results)
+
+    report = {
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "fixtures": args.fixtures or f"synthetic:{args.pages}",
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if save_path:
+        with open(save_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados gravados em {save_path}")
+
+    if baseline_path:
+        with open(baseline_path, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
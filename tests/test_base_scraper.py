@@ -0,0 +1,106 @@
+from unittest import mock
+import os
+import tempfile
+import time
+import unittest
+
+import requests
+
+os.environ["HTTP_CACHE_DIR"] = ""
+os.environ["RATE_LIMIT_REDIS_URL"] = ""
+os.environ["METRICS_REDIS_URL"] = ""
+os.environ["SCRAPER_CAPTURE"] = "off"
+
+from app.scrapers.amazon_scraper import AmazonScraper  # noqa: E402
+from app.scrapers.base_scraper import iter_async  # noqa: E402
+from app.scrapers.http_cache import HttpCache  # noqa: E402
+from app.scrapers.rate_limit import LocalRateLimiter  # noqa: E402
+from benchmarks.fixtures import amazon_page  # noqa: E402
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode("utf-8")
+
+    def raise_for_status(self):
+        pass
+
+
+class FetchSchedulerTest(unittest.TestCase):
+    def test_full_crawl_does_not_rate_limit_itself(self):
+        # 30 URLs somariam 1.4s de espera no bucket se todas reservassem de
+        # uma vez, bem acima de max_token_wait
+        scraper = AmazonScraper()
+        scraper.rate_limiter = LocalRateLimiter()
+        scraper.requests_per_second = 20.0
+        scraper.burst = 2
+        scraper.max_token_wait = 0.5
+        urls = [f"https://www.amazon.com.br/s?k=oferta&page={page}" for page in range(30)]
+        body = amazon_page(0, products=1, filler_blocks=0)
+
+        def fake_get(session, url, **kwargs):
+            time.sleep(0.01)
+            return FakeResponse(body)
+
+        with mock.patch("requests.Session.get", fake_get):
+            pages = list(iter_async(scraper.iter_page_offers(urls)))
+        self.assertEqual(sorted(url for url, _ in pages), sorted(urls))
+        self.assertTrue(all(offers for _, offers in pages))
+
+    def test_fetch_many_keeps_order_and_blanks_failures(self):
+        scraper = AmazonScraper()
+        scraper.rate_limiter = LocalRateLimiter()
+        scraper.requests_per_second = 1e9
+        scraper.burst = 1_000_000
+        urls = [f"https://www.amazon.com.br/s?k={term}" for term in ("tv", "erro", "fone")]
+
+        def fake_get(session, url, **kwargs):
+            if "erro" in url:
+                raise requests.exceptions.ConnectionError("conexão recusada")
+            return FakeResponse(url)
+
+        with mock.patch("requests.Session.get", fake_get):
+            self.assertEqual(scraper.fetch_all(urls), [urls[0], "", urls[2]])
+
+
+class BytesResponse:
+    """Resposta cujo texto não pode ser lido: o caminho em bytes não decodifica"""
+    encoding = "iso-8859-1"
+
+    def __init__(self, content, status_code=200):
+        self.content = content
+        self.status_code = status_code
+        self.headers = {"ETag": '"v1"'}
+
+    @property
+    def text(self):
+        raise AssertionError("corpo decodificado sem necessidade")
+
+    def raise_for_status(self):
+        pass
+
+
+class HttpCacheTest(unittest.TestCase):
+    def test_bytes_round_trip_and_text_uses_response_charset(self):
+        body = "<p>Câmera R$ 1.999</p>".encode("iso-8859-1")
+        scraper = AmazonScraper()
+        scraper.rate_limiter = LocalRateLimiter()
+        url = "https://www.amazon.com.br/s?k=camera"
+
+        with tempfile.TemporaryDirectory() as directory:
+            scraper.http_cache = HttpCache(directory)
+            with mock.patch("requests.Session.get", return_value=BytesResponse(body)):
+                self.assertEqual(scraper.fetch_page(url, throttle=False, as_bytes=True), body)
+
+            not_modified = BytesResponse(b"", status_code=304)
+            with mock.patch("requests.Session.get", return_value=not_modified):
+                self.assertEqual(scraper.fetch_page(url, throttle=False, as_bytes=True), body)
+                self.assertEqual(scraper.fetch_page(url, throttle=False), "<p>Câmera R$ 1.999</p>")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+
+from app.matching import MATCH_THRESHOLD, best_match, product_key, similarity
+
+
+def score(a, b):
+    key_a, key_b = product_key(a), product_key(b)
+    if key_a.block != key_b.block:
+        return 0.0
+    return similarity(key_a.model, key_b.model)
+
+
+class MatchingTest(unittest.TestCase):
+    def test_same_product_across_sites(self):
+        for a, b in [
+            ("Smartphone Samsung Galaxy S23 128GB Preto", "Samsung Galaxy S23 128 GB"),
+            ("Apple iPhone 15 Pro 256GB Titânio", "iPhone 15 Pro 256 GB"),
+            ("Capinha Samsung Galaxy S23", "Capa para Samsung Galaxy S23"),
+        ]:
+            with self.subTest(a=a, b=b):
+                self.assertGreaterEqual(score(a, b), MATCH_THRESHOLD)
+
+    def test_accessories_do_not_match_the_device(self):
+        for a, b in [
+            ("Capa Samsung Galaxy S23", "Samsung Galaxy S23"),
+            ("Película de Vidro iPhone 15 Pro", "Apple iPhone 15 Pro"),
+            ("Carregador Samsung Galaxy S23 Ultra", "Samsung Galaxy S23 Ultra"),
+            ("Capa Samsung Galaxy S23", "Película Samsung Galaxy S23"),
+        ]:
+            with self.subTest(a=a, b=b):
+                self.assertLess(score(a, b), MATCH_THRESHOLD)
+
+    def test_variants_and_model_codes_do_not_match(self):
+        for a, b in [
+            ("Apple iPhone 15 Pro", "Apple iPhone 15 Pro Max"),
+            ("Samsung Galaxy S23", "Samsung Galaxy S24"),
+        ]:
+            with self.subTest(a=a, b=b):
+                self.assertLess(score(a, b), MATCH_THRESHOLD)
+
+    def test_best_match_skips_accessory_candidates(self):
+        phone = product_key("Samsung Galaxy S23 Ultra")
+        case = product_key("Capa Samsung Galaxy S23 Ultra")
+        self.assertIsNone(best_match(phone.model, [(1, case.model)]))
+        self.assertEqual(best_match(phone.model, [(1, case.model), (2, phone.model)]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
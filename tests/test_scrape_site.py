@@ -0,0 +1,131 @@
+"""
+Regressões de 'gone': uma coleta completa com alguma página que falhou
+não pode marcar ofertas como 'gone', e as coletas por shard do planner
+só marcam quando fecham o ciclo de shards do site.
+
+    python -m unittest discover tests
+"""
+from unittest import mock
+import os
+import tempfile
+import time
+import unittest
+
+WORKDIR = tempfile.mkdtemp(prefix="scrape-site-test-")
+os.environ["OFFERS_DB_PATH"] = os.path.join(WORKDIR, "offers.db")
+os.environ["PRICE_HISTORY_DIR"] = os.path.join(WORKDIR, "history")
+os.environ["HTTP_CACHE_DIR"] = ""
+os.environ["RATE_LIMIT_REDIS_URL"] = ""
+os.environ["METRICS_REDIS_URL"] = ""
+os.environ["SCRAPER_CAPTURE"] = "off"
+
+import requests  # noqa: E402
+
+from app.models import Offer  # noqa: E402
+from app.scrapers.amazon_scraper import AmazonScraper  # noqa: E402
+from app.storage import get_store  # noqa: E402
+from app.tasks import scrape_site, summarize_scrape  # noqa: E402
+from benchmarks.fixtures import amazon_page  # noqa: E402
+
+URLS = AmazonScraper().urls
+DELISTED_URL = "https://www.amazon.com.br/dp/DELISTED"
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def __init__(self, text):
+        self.text = text
+        self.content = text.encode("utf-8")
+
+    def raise_for_status(self):
+        pass
+
+
+class ScrapeSiteGoneTest(unittest.TestCase):
+    def setUp(self):
+        self.store = get_store()
+        with self.store._connection() as conn:
+            for table in ("offers", "scrape_cycles", "shard_successes"):
+                conn.execute(f"DELETE FROM {table}")
+        self.store.upsert_offers("amazon", [
+            Offer("Produto que saiu do site", "R$ 10,00", url=DELISTED_URL, timestamp="2000-01-01T00:00:00")
+        ])
+        patches = [
+            mock.patch.object(AmazonScraper, "requests_per_second", 1e9),
+            mock.patch.object(AmazonScraper, "burst", 1_000_000),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def scrape(self, shard=None, failing_url=None, limited_url=None):
+        bodies = {url: amazon_page(seed, products=3, filler_blocks=0) for seed, url in enumerate(URLS)}
+        self.requested = []
+
+        def fake_get(session, url, **kwargs):
+            self.requested.append(url)
+            if url == failing_url:
+                raise requests.exceptions.ConnectionError("conexão recusada")
+            if url == limited_url and self.requested.count(url) == 1:
+                # as outras páginas terminam antes do 429
+                time.sleep(0.2)
+                response = FakeResponse("")
+                response.status_code = 429
+                response.headers = {"Retry-After": "0"}
+                return response
+            return FakeResponse(bodies[url])
+
+        with mock.patch("requests.Session.get", fake_get):
+            return scrape_site.apply(args=("amazon", shard)).get()
+
+    def delisted_offer_kept(self):
+        row = self.store._connection().execute("SELECT 1 FROM offers WHERE url = ?", (DELISTED_URL,)).fetchone()
+        return row is not None
+
+    def test_failed_page_does_not_mark_gone(self):
+        result = self.scrape(failing_url=URLS[1])
+        self.assertEqual(result["status"], "warning")
+        self.assertEqual(result["failed_pages"], 1)
+        self.assertNotIn("gone", result["changes"])
+        self.assertTrue(self.delisted_offer_kept())
+
+    def test_complete_run_marks_gone(self):
+        result = self.scrape()
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["changes"]["gone"], 1)
+        self.assertFalse(self.delisted_offer_kept())
+
+    def test_shard_cycle_marks_gone_once_complete(self):
+        self.assertIsNone(self.scrape(shard=URLS[0])["changes"].get("gone"))
+        self.assertIsNone(self.scrape(shard=URLS[1], failing_url=URLS[1])["changes"].get("gone"))
+        self.assertIsNone(self.scrape(shard=URLS[1])["changes"].get("gone"))
+        self.assertTrue(self.delisted_offer_kept())
+        self.assertEqual(self.scrape(shard=URLS[2])["changes"]["gone"], 1)
+        self.assertFalse(self.delisted_offer_kept())
+
+    def test_rate_limited_retry_resumes_after_saved_pages(self):
+        result = self.scrape(limited_url=URLS[2])
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["count"], 9)
+        # as páginas gravadas antes do 429 não são buscadas de novo
+        self.assertEqual(sorted(self.requested), sorted(URLS + [URLS[2]]))
+
+    def test_foreign_shard_is_rejected_without_fetching(self):
+        result = self.scrape(shard="http://redis:6379/")
+        self.assertEqual(result["status"], "error")
+        self.assertEqual(self.requested, [])
+
+    def test_summary_requires_every_shard_success(self):
+        results = [
+            {"site": "amazon", "status": "success", "count": 3, "elapsed": 0.1},
+            {"site": "amazon", "status": "warning", "count": 0, "elapsed": 0.1},
+        ]
+        summary = summarize_scrape.run(results, 0.0)
+        self.assertNotIn("gone", summary["sites"]["amazon"].get("changes", {}))
+        self.assertTrue(self.delisted_offer_kept())
+
+
+if __name__ == "__main__":
+    unittest.main()